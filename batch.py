@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" headless batch simulation of the scenarios of a json file, only imports the simulation code (no Qt or plotting)
+
+    example file:
+    {"n": 100000, "engine": "vectorized", "scenarios": [
+        {"scenario": "camp1"},
+        {"name": "chuck", "n": 1000000,
+         "attackers": [{"army": "OwnArmy", "cavalry": 165, "recruits": 1}],
+         "defender": {"army": "EnemyArmy", "boss": "Chuck", "guard_dogs": 50, "roughnecks": 100, "ranger": 49}}]}
+"""
+
+import csv
+import json
+from argparse import ArgumentParser
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.runner import Engines
+from src.scenario import Scenario
+from src.store import ResultStore, columns
+from utils.helpers import info
+
+
+def load(file_name, n=None, engine=None):
+    """ :returns list of (scenario, trials, engine) of the scenario file, the values of the file are defaults for all scenarios """
+    with open(file_name) as f:
+        spec = json.load(f)
+    n, engine = spec.get('n', n), spec.get('engine', engine)
+    return [(Scenario.from_dict(s), int(s.get('n', n)), s.get('engine', engine)) for s in spec['scenarios']]
+
+
+def run_task(task):
+    """ :returns the index of the scenario, the summary and, if keep, the data of n fights with the engine and seed state that reproduce it """
+    i, engine, n, seed, attackers, defender, keep = task
+    data = Engines[engine](n, np.random.default_rng(seed), attackers, defender)
+    state = {'engine': engine, 'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key)}  # SeedSequence(entropy, spawn_key=spawn_key) reproduces the chunk
+    return i, Accumulator.from_data(data), (data, state) if keep else None
+
+
+def tasks(scenarios, seed: np.random.SeedSequence, chunk_size, keep):
+    """ splits the scenarios in chunks of trials, every chunk has an independent random stream """
+    for i, ((scenario, n, engine), s) in enumerate(zip(scenarios, seed.spawn(len(scenarios)))):
+        attackers, defender = scenario.armies()
+        for m, chunk_seed in zip([min(chunk_size, n - j) for j in range(0, n, chunk_size)], s.spawn(-(-n // chunk_size))):
+            yield i, engine, m, chunk_seed, attackers, defender, keep
+
+
+def result(scenario: Scenario, engine, acc: Accumulator, q):
+    attackers, defender = scenario.armies()
+    return {'name': scenario.Name, 'engine': engine, 'n': acc.n, 'columns': columns([*attackers, defender]), 'mean': acc.mean().tolist(),
+            'std': acc.std().tolist(), 'quantiles': {str(qi): x.tolist() for qi, x in zip(q, acc.quantile(np.array(q)).T)}}
+
+
+def write(results, file_name):
+    """ writes the results as json or, for the suffix .csv, as one row per scenario and column """
+    file_name = Path(file_name)
+    file_name.parent.mkdir(parents=True, exist_ok=True)
+    with open(file_name, 'w', newline='') as f:
+        if file_name.suffix == '.csv':
+            w = csv.writer(f)
+            qs = list(results[0]['quantiles']) if results else []
+            w.writerow(['scenario', 'engine', 'n', 'column', 'mean', 'std'] + [f'q{q}' for q in qs])
+            for r in results:
+                for j, col in enumerate(r['columns']):
+                    w.writerow([r['name'], r['engine'], r['n'], col, r['mean'][j], r['std'][j]] + [r['quantiles'][q][j] for q in qs])
+        else:
+            json.dump(results, f, indent=1)
+    info(f'wrote the results of {len(results)} scenarios to {file_name}')
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='runs all scenarios of a json file in parallel without any plotting')
+    parser.add_argument('file', help='json file with the scenarios, see the docstring of batch.py')
+    parser.add_argument('--output', '-o', default='results.json', help='summary of every scenario as .json or .csv')
+    parser.add_argument('--store', default=None, help='also append the data of all fights to the result store in this directory')
+    parser.add_argument('-n', type=int, default=10000, help='trials of the scenarios without n')
+    parser.add_argument('--engine', '-e', default='vectorized', choices=list(Engines), help='engine of the scenarios without engine')
+    parser.add_argument('--workers', '-w', type=int, default=cpu_count())
+    parser.add_argument('--chunk-size', '-c', type=int, default=100000)
+    parser.add_argument('--seed', '-s', type=int, default=None)
+    parser.add_argument('--quantiles', '-q', type=float, nargs='+', default=[.05, .5, .95])
+    args = parser.parse_args()
+
+    scenarios = load(args.file, args.n, args.engine)
+    seed = np.random.SeedSequence(args.seed)
+    store = None if args.store is None else ResultStore(args.store)
+    campaigns = [None if store is None else store.campaign(s.Name, *s.armies(), engine, seed.entropy) for s, n, engine in scenarios]
+    accs, done = [Accumulator() for _ in scenarios], [0] * len(scenarios)
+    info(f'running {len(scenarios)} scenarios with {sum(n for s, n, e in scenarios)} trials on {args.workers} workers')
+
+    with Pool(args.workers) as pool:
+        for i, acc, chunk in pool.imap_unordered(run_task, tasks(scenarios, seed, args.chunk_size, store is not None)):
+            accs[i].merge(acc)
+            if chunk is not None:
+                campaigns[i].append(*chunk)
+            done[i] += acc.n
+            info(f'{scenarios[i][0].Name}: {done[i]}/{scenarios[i][1]} trials')
+
+    write([result(s, engine, acc, args.quantiles) for (s, n, engine), acc in zip(scenarios, accs)], args.output)
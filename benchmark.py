@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import subprocess
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+from src.mean_field import MeanFieldSimulation
+from src.runner import Engines
+from src.scenario import Scenarios
+from utils.helpers import Dir, info, print_table
+
+
+def ks_test(x, y):
+    """ two sample Kolmogorov-Smirnov test.
+        :returns the statistic and the asymptotic p-value """
+    x, y = np.sort(x), np.sort(y)
+    v = np.union1d(x, y)
+    d = np.max(np.abs(np.searchsorted(x, v, 'right') / x.size - np.searchsorted(y, v, 'right') / y.size))
+    en = np.sqrt(x.size * y.size / (x.size + y.size))
+    lam = (en + .12 + .11 / en) * d
+    k = np.arange(1, 101)
+    return d, 1. if lam < .2 else float(np.clip(2 * np.sum((-1.) ** (k - 1) * np.exp(-2 * k ** 2 * lam ** 2)), 0, 1))
+
+
+def run(engine, scenario, n, seed):
+    return Engines[engine](n, np.random.default_rng(seed), *scenario.armies())
+
+
+def timeit(engine, scenario, n, seed, repeats):
+    """ :returns the data of the first and the shortest time of all repetitions """
+    t, data = [], None
+    for i in range(repeats):
+        t0 = perf_counter()
+        d = run(engine, scenario, n, seed + i)
+        t.append(perf_counter() - t0)
+        data = d if data is None else data
+    return data, min(t)
+
+
+def peak_memory(engine, scenario, n, seed):
+    tracemalloc.start()
+    run(engine, scenario, n, seed)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def mean_field_error(scenario, ref, repeats=20):
+    """ :returns the latency of the mean field approximation and its deviation from the means of the reference data """
+    attackers, defender = scenario.armies()
+    t0 = perf_counter()
+    for _ in range(repeats):
+        est = MeanFieldSimulation(attackers, defender).run()
+    err = np.abs(est - ref.mean(0))
+    return {'latency_us': 1e6 * (perf_counter() - t0) / repeats, 'max_abs_error': float(err.max()), 'rel_error': float(err.sum() / max(np.abs(ref.mean(0)).sum(), 1))}
+
+
+def benchmark(scenario, engines, n, seed=0, repeats=3, n_latency=20, mean_field=False):
+    """ :returns throughput, latency, peak memory and the per column KS p-values with respect to the first engine
+                 and the deviation of the mean field approximation from the means of the first engine """
+    res, data = {}, {}
+    for engine, m in zip(engines, n):
+        data[engine], t = timeit(engine, scenario, m, seed, repeats)
+        latency = [timeit(engine, scenario, 1, seed + i, 1)[1] for i in range(n_latency)]
+        res[engine] = {'trials': m, 'trials_per_s': m / t, 'latency_ms': 1e3 * np.median(latency), 'peak_memory_mb': peak_memory(engine, scenario, m, seed) / 2 ** 20}
+    ref = data[engines[0]]
+    for engine in engines[1:]:
+        p = [ks_test(x, y)[1] if x.std() + y.std() else 1. for x, y in zip(ref.T, data[engine].T)]
+        res[engine]['ks_p'] = p
+        res[engine]['equivalent'] = bool(min(p) > .01 / len(p))  # Bonferroni corrected
+    if mean_field:
+        res['mean-field'] = mean_field_error(scenario, ref)
+    return res
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=Dir).stdout.strip()
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='throughput, latency, memory and statistical equivalence of the combat engines')
+    parser.add_argument('scenarios', nargs='*', default=list(Scenarios), help=f'choose from {", ".join(Scenarios)}')
+    parser.add_argument('--engines', '-e', nargs='+', default=list(Engines), choices=list(Engines))
+    parser.add_argument('-n', type=int, default=1000, help='trials of the first engine')
+    parser.add_argument('--factor', '-f', type=int, default=10, help='the other engines run this many more trials')
+    parser.add_argument('--seed', '-s', type=int, default=0)
+    parser.add_argument('--mean-field', '-m', action='store_true', help='compare the mean field approximation to the means of the first engine')
+    parser.add_argument('--output', '-o', default=Dir.joinpath('data', 'benchmarks.jsonl'), help='results are appended as one json line per run')
+    args = parser.parse_args()
+
+    n_trials = [args.n] + [args.n * args.factor] * (len(args.engines) - 1)
+    results, rows, mf_rows = {}, [], []
+    for name in args.scenarios:
+        info(f'benchmarking {name} ...')
+        results[name] = benchmark(Scenarios[name], args.engines, n_trials, args.seed, mean_field=args.mean_field)
+        for engine in args.engines:
+            r = results[name][engine]
+            rows.append([name, engine, f'{r["trials_per_s"]:.0f}', f'{r["latency_ms"]:.2f}', f'{r["peak_memory_mb"]:.1f}', f'{min(r["ks_p"]):.3f}' if 'ks_p' in r else '-'])
+        if args.mean_field:
+            r = results[name]['mean-field']
+            mf_rows.append([name, f'{r["latency_us"]:.0f}', f'{r["max_abs_error"]:.1f}', f'{r["rel_error"]:.1%}'])
+    print_table(rows, ['Scenario', 'Engine', 'Trials/s', 'Latency [ms]', 'Peak memory [MB]', 'min KS p'])
+    if args.mean_field:
+        print_table(mf_rows, ['Scenario', 'Mean field [us]', f'max |error| vs. {args.engines[0]}', 'rel. error'])
+
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, 'a') as f:
+        f.write(json.dumps({'time': datetime.now().isoformat(timespec='seconds'), 'commit': commit(), 'seed': args.seed, 'results': results}) + '\n')
+    info(f'appended the results to {args.output}')
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" distributed sweep over compositions of the attacking army, see src/distributed.py. Only imports the simulation code (no Qt or plotting)
+
+    example sweep file:
+    {"scenario": "camp1", "army": "OwnArmy", "fixed": {"general": 1}, "grid": {"soldiers": [50, 100, 150], "longbowmen": [0, 25, 50]},
+     "n": 100000, "chunk_size": 10000}
+"""
+
+import json
+from argparse import ArgumentParser
+from multiprocessing import Process, cpu_count
+
+from src.distributed import Coordinator, Worker
+from src.scenario import Armies, Scenarios, build_army
+from utils.helpers import info
+
+
+def coordinator(file_name, timeout):
+    with open(file_name) as f:
+        spec = json.load(f)
+    defender = Scenarios[spec['scenario']].Defender() if 'scenario' in spec else build_army(spec['defender'])
+    return Coordinator(defender, Armies[spec.get('army', 'OwnArmy')], spec.get('fixed'), spec.get('n', 1000), spec.get('chunk_size', 1000), spec.get('seed'),
+                       spec.get('engine', 'vectorized'), timeout, **spec['grid'])
+
+
+def work(host, port):
+    info(f'worker finished {Worker(host, port).run()} units')
+
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='distributes a composition sweep to workers on several hosts over TCP')
+    parser.add_argument('mode', choices=['coordinator', 'worker'])
+    parser.add_argument('file', nargs='?', help='json file of the sweep (coordinator), see the docstring of distributed.py')
+    parser.add_argument('--host', default=None, help='address to listen on (coordinator, default all) or of the coordinator (worker, default localhost)')
+    parser.add_argument('--port', '-p', type=int, default=5555)
+    parser.add_argument('--output', '-o', default='sweep.json', help='means of all columns on the grid (coordinator)')
+    parser.add_argument('--timeout', '-t', type=float, default=600, help='seconds until the units of a silent worker are handed out again')
+    parser.add_argument('--processes', '-n', type=int, default=cpu_count(), help='local worker processes (worker)')
+    args = parser.parse_args()
+
+    if args.mode == 'coordinator':
+        c = coordinator(args.file, args.timeout)
+        c.run(args.host or '0.0.0.0', args.port)
+        with open(args.output, 'w') as f:
+            json.dump({'axes': {key: v.tolist() for key, v in c.Axes.items()}, 'columns': c.columns, 'n': [acc.n for acc in c.Accs],
+                       'mean': c.mean().tolist()}, f)
+        info(f'wrote the means of {len(c.Configs)} configurations to {args.output}')
+    else:
+        workers = [Process(target=work, args=(args.host or 'localhost', args.port)) for _ in range(args.processes)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
@@ -1,9 +1,22 @@
 from src.army import *
 from src.boss import *
-from plotting.save import SaveDraw, hist_xy, mean_sigma
+from plotting.save import SaveDraw, hist_xy
 # from utils.classes import PBAR
-from functools import partial
 from src.mine import *
+from src.exact import ExactSimulation
+from src.mean_field import MeanFieldSimulation
+from src.runner import Runner, one_round
+from src.optimizer import Optimizer
+from src.cache import BattleCache
+from src.crn import Comparison
+from src.checkpoint import Checkpoint
+from src.sweep import Sweep
+from src.surrogate import Surrogate
+from src.store import ResultStore
+from src.scenario import army_spec
+from src.service import SimulationClient
+from src.rare import RareEvent, losses
+from src.simulate import simulate
 
 
 # TODO: add mine timer
@@ -12,6 +25,11 @@ from src.mine import *
 # 32772
 
 d = SaveDraw()
+runner = Runner()
+cache = BattleCache()
+surrogates = {}
+store = ResultStore()
+client = SimulationClient()
 
 recruits = OwnArmy(200)
 bm = OwnArmy(bowmen=200)
@@ -23,14 +41,8 @@ me = OwnArmy(1, 0, 0, 165, 0, 0)
 enemy = Chuck + EnemyArmy(0, 0, 50, 100, 0, 49)
 
 
-def _sim_1r(attacker: Battalion, defender: Battalion):
-    defender.revive()
-    attacker.attack(defender)
-    return defender.N - defender.n_alive
-
-
 def sim_1r(attacker: Battalion, defender: Battalion, n=1000):
-    return np.array(parallelise(_sim_1r, [[attacker, defender]] * n))
+    return runner.run(one_round, n, 1, attacker, defender).ravel()
 
 
 def show_1r(attacker: Battalion = None, defender: Battalion = None, n=1000):
@@ -38,44 +50,126 @@ def show_1r(attacker: Battalion = None, defender: Battalion = None, n=1000):
     return d.distribution(sim_1r(x, y, n), w=1, q=.002, rf=1, lf=1, normalise=True, gridy=True, x_tit=f'Lost {y.Unit.Name}s')
 
 
-def _sim(*armies):
-    enemy.revive()
-    for army in armies:
-        army.revive()
-        army.attack(enemy)
-    return np.append(np.concatenate([army.data for army in armies]), enemy.data)
+def sim(*armies, n=1000, engine=None, width=None, q=None):
+    """ runs n fights or, if width is given, as many as needed to reach the width of the confidence intervals of the means (or the quantiles q) """
+    armies = armies if len(armies) else [me]
+    return runner.fight(armies, enemy, n, engine) if width is None else runner.adaptive(armies, enemy, width, q, engine=engine)
 
 
-def sim(*armies, n=1000):
-    f = partial(_sim, *armies)
-    return np.array(parallelise(f, [[]] * n))
+def sim_auto(*armies, n=None, precision=None, engine=None):
+    """ :returns the Result of the fights against the enemy from the fastest engine (exact, object, vectorized or pooled), see simulate """
+    return simulate(armies if len(armies) else [me], enemy, n, precision, engine, runner=runner)
 
 
-def minimise(i_unit=0, xmin=20, xmax=100, s=1, n=100):
+def minimise(i_unit=0, xmin=20, xmax=100, s=1, n=100, antithetic=False, checkpoint=None):
+    """ :param checkpoint: file name, the simulated points are saved there and not simulated again after an interruption """
     x = np.arange(xmin, xmax, s)
-    y = np.array([[mean_sigma(x)[0] for x in sim(OwnArmy(1, cavalry=i, soldiers=1), n=n).T] for i in x]).T
+    c = Comparison(enemy, antithetic=antithetic, chunk_size=n, checkpoint=None if checkpoint is None else Checkpoint(checkpoint))  # common random numbers for all points
+    y = np.array([c.run(OwnArmy(1, cavalry=i, soldiers=1), n).mean(0) for i in x]).T
     y = np.sum(y[i_unit], axis=0) if is_iter(i_unit) else y[i_unit]
     return d.graph(x, y)
 
 
-def show(*armies, i=0, n=1000):
+def sweep(n=100, fixed=None, batch_size=None, checkpoint=None, **grid):
+    """ :returns the mean losses of all compositions of the grid (e.g. cavalry=range(0, 100, 10), soldiers=range(50, 150, 10)) against the enemy,
+        with a checkpoint file an interrupted sweep resumes after the last finished batch """
+    s = Sweep(enemy, fixed=fixed, **grid)
+    s.run(n, batch_size, None if checkpoint is None else Checkpoint(checkpoint))
+    return s
+
+
+def sim_service(*armies, n=10000, engine='vectorized'):
+    """ :returns the final statistics of n fights from the running simulation service (python service.py) """
+    armies = armies if len(armies) else [me]
+    return client({'attackers': [army_spec(a) for a in armies], 'defender': army_spec(enemy), 'n': n, 'engine': engine})
+
+
+def sim_stored(name, *armies, n=1000, engine=None):
+    """ appends n fights of the armies against the enemy to the campaign with the given name in the result store """
+    armies = armies if len(armies) else [me]
+    c = store.campaign(name, armies, enemy, choose(engine, 'vectorized'), runner.state(0))
+    return runner.stream(armies, enemy, n, c, engine)
+
+
+def lookup(name, **counts):
+    """ :returns the mean losses and rounds of the composition (e.g. soldiers=100, longbowmen=50) from the precomputed grid of the named camp,
+        see Surrogate.build """
+    if name not in surrogates:
+        surrogates[name] = Surrogate(name, runner)
+    return surrogates[name](**counts)
+
+
+def sim_cached(*armies, n=1000, engine=None):
+    """ :returns the summary of at least n fights, only the fights missing in the cache are simulated """
+    return cache.fight(armies if len(armies) else [me], enemy, n, runner, engine)
+
+
+def optimise(army: Army = None, units=None, q=None, step=40, keep=None):
+    """ :returns the OwnArmy with the lowest expected losses (or quantile q of the losses) against the army (default enemy),
+        only the best fraction keep of the compositions by the mean field approximation are simulated """
+    return Optimizer(choose(army, enemy), units, q=q, keep=keep).run(step)
+
+
+def estimate(*armies):
+    """ :returns the approximate mean losses and rounds of the armies against the enemy within microseconds """
+    return MeanFieldSimulation(armies if len(armies) else [me], enemy).run()
+
+
+def risk(*armies, i=0, k=1, n=2e4, refine=True):
+    """ :returns the probability of at least k losses in column i (e.g. the general) against the enemy, its error and confidence interval
+        from n importance sampled fights, accurate down to probabilities far below 1/n """
+    r = RareEvent(armies if len(armies) else [me], enemy, losses(i, k))
+    r.tune()
+    if refine:
+        r.refine()
+    return r.estimate(n)
+
+
+def print_distribution(tit, x, y, pmin=.005):
+    info(f'{tit}: ')
+    for xi, yi in zip(x, y):
+        if yi > pmin:
+            print(f'  {xi:.0f}: {yi:4.1%}')
+
+
+def show(*armies, i=0, n=1000, width=None, q=None):
     armies = armies if len(armies) else [me]
-    data = sim(*armies, n=n).T
+    data = sim(*armies, n=n, width=width, q=q).T
     a = data[i]
     if np.any(a):
         a = d.distribution(np.array(a), w=1, q=.002, rf=1, lf=1, normalise=True, gridy=True, x_tit=f'Lost {armies[-1][0].Unit.Name}s')
-        info(f'{armies[-1][0].Unit.Name} losses: ')
-        for x, y in zip(*hist_xy(a, raw=True)):
-            if y > 0.005:
-                print(f'  {x:.0f}: {y:4.1%}')
+        print_distribution(f'{armies[-1][0].Unit.Name} losses', *hist_xy(a, raw=True))
     else:
         info('No losses :-)')
     i_last_rnd = sum(army.N + 1 for army in armies) - 1
     b = d.distribution(np.array(data[i_last_rnd]), w=1, q=.002, rf=1, lf=1, normalise=True, gridy=True, show=False, x_tit='Number of Rounds')
-    info(f'Number of Rounds: ')
-    for x, y in zip(*hist_xy(b, raw=True)):
-        if y > 0.005:
-            print(f'  {x:.0f}: {y:4.1%}')
+    print_distribution('Number of Rounds', *hist_xy(b, raw=True))
+
+
+def show_summary(*armies, i=0, n=1e6, checkpoint=None):
+    """ prints the distributions of the losses and rounds of n fights from streaming accumulators in constant memory,
+        with a checkpoint file an interrupted run resumes after the last finished chunk """
+    armies = armies if len(armies) else [me]
+    s = runner.summarise(armies, enemy, n, checkpoint=None if checkpoint is None else Checkpoint(checkpoint))
+    print_distribution(f'{armies[0][i].Unit.Name} losses', *s.distribution(i))
+    print_distribution('Number of Rounds', *s.distribution(armies[0].N))
+    return s
+
+
+def show_stored(name, i=0):
+    """ prints the distributions of the losses and rounds of a stored campaign, the chunks are read one by one """
+    c = store[name]
+    print_distribution(c.columns[i], *c.distribution(i))
+    print_distribution('Number of Rounds', *c.distribution('Rounds'))
+    return c
+
+
+def show_exact(army: Army = None, i=0, cutoff=1e-12):
+    army = choose(army, me)
+    s = ExactSimulation(army, enemy, cutoff)
+    for j, tit in [(i, f'{army[i].Unit.Name} losses'), (army.N, 'Number of Rounds')]:
+        print_distribution(tit, *s.distribution(j))
+    return s
 
 
 def print_attack(*armies):
@@ -89,7 +183,11 @@ def print_attack(*armies):
 
 
 pa = print_attack
+se = show_exact
+est = estimate
+ss = show_summary
 m = minimise
+o = optimise
 
 
 if __name__ == '__main__':
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+""" local simulation service with a warm process pool, see src/service.py. Only imports the simulation code (no Qt or plotting). """
+
+import asyncio
+from argparse import ArgumentParser
+
+from src.service import SimulationService
+
+if __name__ == '__main__':
+
+    parser = ArgumentParser(description='serves simulation requests (json lines) on a Unix socket or a localhost port')
+    parser.add_argument('--socket', default=None, help='path of the Unix socket, default data/service.sock')
+    parser.add_argument('--port', '-p', type=int, default=None, help='serve on this localhost port instead of the socket')
+    parser.add_argument('--workers', '-w', type=int, default=None)
+    parser.add_argument('--chunk-size', '-c', type=int, default=20000)
+    parser.add_argument('--tables', '-t', type=int, default=512, help='kill tables cached per worker')
+    parser.add_argument('--warm', action='store_true', help='fill the kill tables of the standard scenarios when the workers start')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(SimulationService(args.socket, args.port, args.workers, args.chunk_size, n_tables=args.tables, warm=args.warm).serve())
+    except KeyboardInterrupt:
+        pass
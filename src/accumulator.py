@@ -0,0 +1,100 @@
+from io import BytesIO
+
+import numpy as np
+
+
+class Accumulator:
+    """ streaming summary of fights in constant memory: exact integer histograms and running moments of all columns of Army.data.
+        Accumulators of different batches or processes merge exactly. """
+
+    def __init__(self, n_cols=0):
+
+        self.N = 0
+        self.Mean = np.zeros(n_cols)
+        self.M2 = np.zeros(n_cols)  # summed squared deviations from the mean
+        self.Hists = np.zeros((n_cols, 1), 'i8')  # shape (columns, max value + 1)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {self.N} fights'
+
+    def __add__(self, other: 'Accumulator'):
+        acc = Accumulator(self.Mean.size)
+        return acc.merge(self).merge(other)
+
+    @classmethod
+    def from_data(cls, data: np.ndarray):
+        """ :param data: array with shape (trials, columns) as returned by Runner.fight """
+        return cls(data.shape[1]).add(data)
+
+    @classmethod
+    def from_bytes(cls, b):
+        with np.load(BytesIO(b)) as f:
+            acc = cls()
+            acc.N, acc.Mean, acc.M2, acc.Hists = int(f['n']), f['mean'], f['m2'], f['hists']
+            return acc
+
+    def to_bytes(self):
+        with BytesIO() as f:
+            np.savez(f, n=self.N, mean=self.Mean, m2=self.M2, hists=self.Hists)
+            return f.getvalue()
+
+    # ----------------------------------------
+    # region UPDATE
+    def add_hists(self, hists):
+        if hists.shape[1] > self.Hists.shape[1]:
+            self.Hists = np.hstack([self.Hists, np.zeros((self.Hists.shape[0], hists.shape[1] - self.Hists.shape[1]), 'i8')])
+        self.Hists[:, :hists.shape[1]] += hists
+
+    def add_moments(self, n, mean, m2):
+        """ merges the moments of another sample (Chan et al.) """
+        if n:
+            delta, n_tot = mean - self.Mean, self.N + n
+            self.Mean = self.Mean + delta * n / n_tot
+            self.M2 = self.M2 + m2 + delta ** 2 * self.N * n / n_tot
+            self.N = n_tot
+
+    def add(self, data: np.ndarray):
+        """ adds a batch of trials with shape (trials, columns) """
+        if data.shape[0]:
+            if not self.Mean.size:
+                self.__init__(data.shape[1])
+            self.add_hists(np.array([np.bincount(col, minlength=data.max() + 1) for col in data.T], 'i8'))
+            mean = data.mean(0)
+            self.add_moments(data.shape[0], mean, ((data - mean) ** 2).sum(0))
+        return self
+
+    def merge(self, other: 'Accumulator'):
+        if other.N:
+            if not self.Mean.size:
+                self.__init__(other.Mean.size)
+            self.add_hists(other.Hists)
+            self.add_moments(other.N, other.Mean, other.M2)
+        return self
+    # endregion UPDATE
+    # ----------------------------------------
+
+    @property
+    def n(self):
+        return self.N
+
+    @property
+    def x(self):
+        return np.arange(self.Hists.shape[1])
+
+    def mean(self):
+        return self.Mean
+
+    def var(self):
+        return self.M2 / (self.N - 1) if self.N > 1 else np.full(self.Mean.size, np.nan)
+
+    def std(self):
+        return np.sqrt(self.var())
+
+    def quantile(self, q):
+        """ :returns the exact q-quantiles of all columns """
+        return np.array([np.searchsorted(c, q * self.N) for c in np.cumsum(self.Hists, axis=1)])
+
+    def distribution(self, i):
+        """ :returns the values and probabilities of the i-th column """
+        x = np.flatnonzero(self.Hists[i])
+        return x, self.Hists[i, x] / self.N
@@ -1,6 +1,8 @@
 from utils.helpers import *
 from src.units import *
 from src.battalion import Battalion
+from src.instrumentation import Stats
+from time import perf_counter
 
 Verbose = False
 
@@ -62,13 +64,25 @@ class Army:
         self.Speeds = np.insert(self.Speeds, pos, other.Unit.Speed)
         return self
 
+    def override(self, name, accuracy=None, splash=None, flanking=None):
+        """ overrides the stats of the unit with the given name only for this army """
+        for bat in self:
+            if bat.Unit.Name == name:
+                bat.set_unit(bat.Unit.replace(accuracy, splash, flanking))
+        return self
+
     def hp_indices(self):
         hp = [bat.Unit.HP for bat in self]
         return np.append(np.argsort(hp[:-1]), self.N - 1) if self.N and self[-1].Unit.Name == 'General' else np.argsort(hp)
 
     @property
     def data(self):
-        return np.append([bat.NDefeated for bat in self], self.NRounds)
+        return self.format_data(np.array([bat.NDefeated for bat in self]), self.NRounds)
+
+    @staticmethod
+    def format_data(n_defeated, n_rounds):
+        """ :returns the losses of all battalions followed by the number of rounds (along the first axis) """
+        return np.append(n_defeated, [n_rounds], axis=0)
 
     @property
     def size(self):
@@ -78,21 +92,25 @@ class Army:
         return [i for i in (self.IHP if flanking else range(self.N)) if self[i].alive]
 
     def has_speed_units(self, speed):
-        return any(self[i].alive for i in np.where(self.Speeds == speed)[0])
+        return any(bat.alive for bat in self.speed_batallions(speed))
 
     @property
     def defeated(self):
-        return np.all([bat.defeated for bat in self])
+        return all(bat.defeated for bat in self)
 
     @property
     def defeated_(self):
-        return np.all([bat.defeated_ for bat in self])
+        return all(bat.defeated_ for bat in self)
 
     def revive(self):
         for bat in self:
             bat.revive()
         self.NRounds = 0
 
+    def set_rng(self, rng: np.random.Generator = None):
+        for bat in self:
+            bat.Rng = rng
+
     def speed_batallions(self, speed):
         return filter(lambda x: x.Unit.Speed == speed, self.Batallions)
 
@@ -105,28 +123,34 @@ class Army:
             indices = iter(army.indices(bat.Unit.Flanking))
             while bat.can_attack and not army.defeated_:
                 (bat.print_attack if prnt else bat._attack)(army[next(indices)])
-            bat.NAttacks = 0
+            bat.end_attack()
 
     def attack(self, army: 'Army', prnt=False):
         while not self.defeated and not army.defeated:
             print_banner(f'ROUND {self.NRounds}', color='yellow', prnt=Verbose)
             for speed in [s for s in [2, 1, 0] if self.has_speed_units(s) or army.has_speed_units(s)]:
+                t = perf_counter() if Stats.Enabled else 0
                 print_small_banner(f'{SpeedDict[speed]} units', color='yellow', prnt=Verbose)
                 self._attack(army, speed, prnt)  # bath attacks happen in parallel
                 info('Enemy attacking!', color='red', blank_lines=1, prnt=Verbose)
                 army._attack(self, speed, prnt)
                 self.update_n_defeated()
                 army.update_n_defeated()
+                if Stats.Enabled:
+                    Stats.count('phases')
+                    Stats.time(f'{SpeedDict[speed]} phase', perf_counter() - t)
             self.NRounds += 1
+            if Stats.Enabled:
+                Stats.count('rounds')
         loser = self if self.defeated else army
         print_banner(f'{loser} was defeated after {self.NRounds} round{"s" if self.NRounds > 1 else ""}', color='red', prnt=Verbose)
 
 
 class OwnArmy(Army):
-    Units = [Recruit, Militia, Soldier, Cavalry, Bowman, Longbowman, Crossbowman, General]
+    Units = [Recruit, Militia, Soldier, Cavalry, Bowman, Longbowman, General]
 
-    def __init__(self, recruits=0, militia=0, soldiers=0, cavalry=0, bowmen=0, longbowmen=0, crossbowmen=0, general=1):
-        super().__init__(recruits, militia, soldiers, cavalry, bowmen, longbowmen, crossbowmen, general)
+    def __init__(self, recruits=0, militia=0, soldiers=0, cavalry=0, bowmen=0, longbowmen=0, general=1):
+        super().__init__(recruits, militia, soldiers, cavalry, bowmen, longbowmen, general)
 
 
 class EnemyArmy(Army):
@@ -135,24 +159,18 @@ class EnemyArmy(Army):
     def __init__(self, scavengers=0, thugs=0, guard_dogs=0, roughnecks=0, stonethrowers=0, ranger=0):
         super().__init__(scavengers, thugs, guard_dogs, roughnecks, stonethrowers, ranger)
 
-    @property
-    def data(self):
-        return np.array([bat.NDefeated for bat in self])
+    @staticmethod
+    def format_data(n_defeated, n_rounds):
+        return n_defeated
 
 
 class DeserterArmy(Army):
-    Units = deepcopy([Recruit, Militia, Cavalry, Soldier, EliteSoldier, Bowman, Longbowman, Cannoneer])
-    Accuracy = [.6, .6, .6, .65, .7, .6, .6, .7]
-
-    def __init__(self, recruits=0, militia=0, cavalry=0, soldiers=0, elite_soldiers=0, bowmen=0, longbowmen=0, cannoneers=0):
+    Accuracy = [.6, .6, .6, .65, .6, .6]
+    Units = [u.replace(acc) for u, acc in zip([Recruit, Militia, Cavalry, Soldier, Bowman, Longbowman], Accuracy)]  # elite soldiers and cannoneers are missing
 
-        self.set_accuracies()
-        super().__init__(recruits, militia, cavalry, soldiers, elite_soldiers, bowmen, longbowmen, cannoneers)
+    def __init__(self, recruits=0, militia=0, cavalry=0, soldiers=0, bowmen=0, longbowmen=0):
+        super().__init__(recruits, militia, cavalry, soldiers, bowmen, longbowmen)
 
-    def set_accuracies(self):
-        for i, acc in enumerate(self.Accuracy):
-            self.Units[i].set_accuracy(acc)
-
-    @property
-    def data(self):
-        return np.array([bat.NDefeated for bat in self])
+    @staticmethod
+    def format_data(n_defeated, n_rounds):
+        return n_defeated
@@ -1,5 +1,8 @@
+from bisect import bisect_left
+from itertools import accumulate
+
+from src.instrumentation import Stats
 from src.units import Unit
-from copy import deepcopy
 from utils.helpers import info
 
 import numpy as np
@@ -12,32 +15,37 @@ class Battalion:
 
         self.N = n
         self.Unit = unit
-        self.Units = [deepcopy(unit) for _ in range(n)]
         self.HP = self.N * self.Unit.HP
         self.P, self.Q = self.Unit.Accuracy, 1 - self.Unit.Accuracy
 
+        # state of the single units, they always die in order so the dead units are the first INext
+        self.CurrentHP = np.full(self.N, self.Unit.HP)
+        self.Hits = np.zeros(self.N, 'i')
+        self.Dead = np.zeros(self.N, '?')
+        self.INext = 0
+
         self.NAttacks: int | np.ndarray = 0
         self.NDefeated = 0
-        self.NAlive: int | np.ndarray = self.N
-        self.ExcessDmg = 0
+        self.NAlive: int | np.ndarray = self.N  # alive units at the start of the speed phase
+        self.ExcessDmg = 0  # damage of a splash unit that carries over to the next battalion
+        self.Splashes, self.Dmgs, self.Runs = None, None, None  # random draws of the attacking units
+        self.Rng: np.random.Generator | None = None  # global numpy random state if None
+        self.Nominal: Unit | None = None  # unbiased unit if the draws are biased for importance sampling (see RareEvent)
 
     def __repr__(self):
         return f'{self.Unit.Name} Batallion ({self.N})'
 
-    def __getitem__(self, item):
-        return self.Units[item]
-
     @property
     def alive_str(self):
         return f'{self.n_alive}/{self.N}'
 
     @property
     def n_alive(self):
-        return np.count_nonzero([not u.Dead for u in self.Units])
+        return self.N - self.INext
 
     @property
     def can_attack(self):
-        return np.any(self.n_can_attack > 0)
+        return self.n_can_attack > 0
 
     @property
     def n_can_attack(self):
@@ -45,11 +53,11 @@ class Battalion:
 
     @property
     def defeated(self):
-        return np.all(self.NDefeated == self.N)
+        return self.NDefeated == self.N
 
     @property
     def defeated_(self):
-        return self.Units[-1].Dead
+        return self.INext == self.N
 
     @property
     def alive(self):
@@ -57,18 +65,32 @@ class Battalion:
 
     @property
     def next(self):
-        return next(unit for unit in self.Units if not unit.Dead)
+        """ :returns index of the next alive unit """
+        if self.defeated_:
+            raise StopIteration
+        return self.INext
 
     @property
     def dmg(self):
-        return sum(u.dmg for u in self)
+        return np.sum(self._dmg(self.n_alive))
+
+    def set_unit(self, unit: Unit):
+        self.Unit = unit
+        self.P, self.Q = self.Unit.Accuracy, 1 - self.Unit.Accuracy
+        self.revive()
 
     def update_n_defeated(self):
-        self.NDefeated = self.N - self.n_alive
+        self.NAlive = self.n_alive
+        self.NDefeated = self.N - self.NAlive
 
     def revive(self):
-        for unit in self.Units:
-            unit.revive()
+        self.CurrentHP[:] = self.Unit.HP
+        self.Hits[:] = 0
+        self.Dead[:] = False
+        self.INext = 0
+        self.NAlive = self.N
+        self.ExcessDmg = 0
+        self.Dmgs = None
         self.reset()
 
     def reset_attacks(self):
@@ -79,42 +101,92 @@ class Battalion:
         self.NDefeated = 0
 
     def splash(self, n):
-        return rnd.random(n) < self.Unit.Splash if 0 < self.Unit.Splash < 1 else np.full(n, bool(self.Unit.Splash))
+        return (self.Rng or rnd).random(n) < self.Unit.Splash if 0 < self.Unit.Splash < 1 else np.full(n, bool(self.Unit.Splash))
 
     def _dmg(self, n):
-        return np.array([self.Unit.DmgMin, self.Unit.DmgMax])[np.array(rnd.random(n) < self.Unit.Accuracy, dtype='i')]
+        return np.where((self.Rng or rnd).random(n) < self.Unit.Accuracy, self.Unit.DmgMax, self.Unit.DmgMin)
+
+    def kill(self, n):
+        self.Dead[self.INext:self.INext + n] = True
+        self.CurrentHP[self.INext:self.INext + n] = 0
+        self.INext += n
+
+    def take_hits(self, dmg: np.ndarray):
+        """ single target attacks, each hitting the next alive unit. Damage exceeding the HP of the unit is lost.
+            :returns the number of attacks until the battalion is defeated """
+        if dmg.size and dmg.min() >= self.Unit.HP:  # every attack kills a unit
+            n = min(dmg.size, self.n_alive)
+            self.Hits[self.INext:self.INext + n] += 1
+            self.kill(n)
+            return n
+        dmg, kills, n_max = list(accumulate(dmg.tolist())), [0], self.n_alive  # kills: index of the attack after each kill
+        j, hp = bisect_left(dmg, self.CurrentHP[self.INext]), self.CurrentHP[self.INext]
+        while j < len(dmg):
+            kills.append(j + 1)
+            if len(kills) > n_max:
+                break
+            j, hp = bisect_left(dmg, dmg[j] + self.Unit.HP, j + 1), self.Unit.HP
+        self.Hits[self.INext:self.INext + len(kills) - 1] += np.array([j - i for i, j in zip(kills, kills[1:])], 'i')
+        self.kill(len(kills) - 1)
+        if not self.defeated_ and kills[-1] < len(dmg):
+            self.CurrentHP[self.INext] = hp - (dmg[-1] - dmg[kills[-1] - 1] if kills[-1] else dmg[-1])
+            self.Hits[self.INext] += len(dmg) - kills[-1]
+        return kills[-1] if self.defeated_ else len(dmg)
+
+    def take_splash(self, dmg):
+        """ splash attack, the damage spills over to the next alive units.
+            :returns the damage exceeding the HP of all alive units """
+        front = int(self.CurrentHP[self.INext])
+        if Stats.Enabled and dmg > front and self.n_alive > 1:
+            Stats.count('splash spill-overs')
+        if dmg < front:
+            self.CurrentHP[self.INext] -= dmg
+            self.Hits[self.INext] += 1
+            return 0
+        n = min(1 + (dmg - front) // self.Unit.HP, self.n_alive)
+        rest = dmg - front - (n - 1) * self.Unit.HP
+        self.Hits[self.INext:self.INext + n] += 1
+        self.kill(n)
+        if self.defeated_:
+            return rest
+        if rest:
+            self.CurrentHP[self.INext] -= rest
+            self.Hits[self.INext] += 1
+        return 0
+
+    def draw(self):
+        """ draws splash and damage of all units attacking in this phase """
+        n = self.n_can_attack
+        self.Splashes, self.Dmgs = self.splash(n), self._dmg(n)
+        self.Runs = np.append(np.flatnonzero(np.diff(self.Splashes)) + 1, n).tolist() if 0 < self.Unit.Splash < 1 else [n]  # attacks of the same type
+
+    def end_attack(self):
+        self.NAttacks = self.ExcessDmg = 0
+        self.Dmgs = None
 
     def _attack(self, battalion: 'Battalion'):
-        n = self.n_can_attack
-        splash = self.splash(n)
-        dmg = self._dmg(n)
-        for i, unit in enumerate(self.Units[-n:]):  # last n can attack
-            try:
-                if splash[i]:
-                    if unit.CurrentDmg is None:
-                        unit.CurrentDmg = dmg[i]
-                    while unit.CurrentDmg > 0:
-                        unit.splash_attack(battalion.next)
-                    unit.reset_current_dmg()  # only gets called if the unit runs out of damage
-                else:
-                    unit.attack(battalion.next, dmg[i])
-                self.NAttacks += 1
-            except StopIteration:
+        if self.Dmgs is None:
+            self.draw()
+        if Stats.Enabled:
+            Stats.count('attack calls')
+        i0 = i = self.NAttacks
+        for j in filter(lambda x: x > i0, self.Runs):
+            if self.Splashes[i]:
+                while i < j and not battalion.defeated_:
+                    self.ExcessDmg = self.Unit.splash_attack(battalion, self.ExcessDmg or int(self.Dmgs[i]))
+                    if self.ExcessDmg:  # the unit continues with the excess damage on the next battalion
+                        if Stats.Enabled:
+                            Stats.count('excess carries')
+                        break
+                    i += 1
+            elif not battalion.defeated_:  # single target attacks all go to the same battalion
+                i += battalion.take_hits(self.Dmgs[i:j])
+            if i < j:  # battalion was defeated
                 break
+        self.NAttacks = i
 
     def print_attack(self, battalion: 'Battalion'):
         if battalion is not None:
             n0, n1 = self.n_can_attack, battalion.n_alive
             self._attack(battalion)
             info(f'{n0} {self.Unit.Name} killed {n1 - battalion.n_alive} {battalion.Unit.Name} ({battalion.alive_str})')
-
-    def sim_attack(self, battallion: 'Battalion', s=10000):
-        n = self.n_can_attack
-        first_kill = self.Unit.DmgMax > battallion.Unit.HP
-        p = self.Unit.Accuracy
-        r = rnd.random(n * s)
-        kills = rnd.random(n * s) < 1 - p + p * p
-        kills[::n] = r[::n] < p
-        kills = np.array_split(kills, s)
-        n_kills = np.sum(kills, axis=1)
-        return n_kills
@@ -1,3 +1,5 @@
+from copy import deepcopy
+
 from src.army import Battalion, Unit, Army
 
 
@@ -7,17 +9,16 @@ class Boss(Battalion):
         super().__init__(1, Unit(name, hp, dmg_min, dmg_max, accuracy, speed, splash, flanking))
 
         self.Name = name
-        self.Unit = self[0]
 
     def __repr__(self):
         return f'Boss {self.Name} ({self.alive_str})\n'
 
     def __add__(self, other: Army):
-        return other.add(self, pos=0)
+        return other.add(deepcopy(self), pos=0)  # the bosses below are shared prototypes
 
     @property
     def alive_str(self):
-        return f'{self.Unit.CurrentHP}/{self.Unit.HP} HP'
+        return f'{self.CurrentHP[0]}/{self.Unit.HP} HP'
 
 
 Skunk = Boss('Skunk', 5000, 1, 100, .5, 0)
@@ -25,3 +26,5 @@ OneEyedBert = Boss('One-Eyed Bert', 6000, 300, 500, .5, 0)
 MetalTooth = Boss('Metal Tooth', 11000, 250, 500, .5, 0)
 Chuck = Boss('Chuck', 9000, 2000, 2500, .5, 0)
 WildMary = Boss('Wild Mary', 60000, 740, 800, .5, 2, 1, False)
+
+Bosses = {boss.Name: boss for boss in [Skunk, OneEyedBert, MetalTooth, Chuck, WildMary]}
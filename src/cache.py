@@ -0,0 +1,84 @@
+import json
+import sqlite3
+from hashlib import sha1
+from time import time
+
+from src.accumulator import Accumulator
+from src.army import Army
+from src.runner import Runner, encode
+from utils.helpers import Dir, choose, info
+
+
+class BattleCache:
+    """ sqlite store of fight summaries, keyed by the canonical encoding of the armies and the engine.
+        New trials are merged into existing entries, the least recently used ones are evicted beyond max_size (in bytes). """
+
+    def __init__(self, file_name=None, max_size=100e6):
+
+        self.FileName = choose(file_name, Dir.joinpath('data', 'battles.sqlite'))
+        self.MaxSize = max_size
+        self.Connection = None
+
+    def __repr__(self):
+        n, size = self.execute('SELECT COUNT(*), TOTAL(size) FROM battles').fetchone()
+        return f'{self.__class__.__name__} with {n} entries ({size / 1e6:.1f} MB)'
+
+    @property
+    def connection(self):
+        if self.Connection is None:
+            self.FileName.parent.mkdir(parents=True, exist_ok=True)
+            self.Connection = sqlite3.connect(self.FileName, check_same_thread=False)  # the service calls it from its cache thread
+            self.Connection.execute('CREATE TABLE IF NOT EXISTS battles (key TEXT PRIMARY KEY, armies TEXT, summary BLOB, size INTEGER, used REAL)')
+        return self.Connection
+
+    def execute(self, *args):
+        with self.connection as c:
+            return c.execute(*args)
+
+    # ----------------------------------------
+    # region KEYS
+    @staticmethod
+    def key(attackers, defender: Army, engine='vectorized'):
+        """ :returns the hash of the armies and the engine and the json of the armies, see runner.encode (includes bosses and accuracy overrides) """
+        armies = json.dumps(encode([*attackers, defender]), default=lambda x: x.item())
+        return sha1(f'{engine}:{armies}'.encode()).hexdigest(), armies
+    # endregion KEYS
+    # ----------------------------------------
+
+    def get(self, key) -> Accumulator | None:
+        row = self.execute('SELECT summary FROM battles WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self.execute('UPDATE battles SET used = ? WHERE key = ?', (time(), key))
+        return None if row is None else Accumulator.from_bytes(row[0])
+
+    def add(self, key, armies, summary: Accumulator):
+        """ merges the summary into the entry of the key. :returns the merged summary """
+        old = self.get(key)
+        summary = summary if old is None else old + summary
+        b = summary.to_bytes()
+        self.execute('INSERT OR REPLACE INTO battles VALUES (?, ?, ?, ?, ?)', (key, armies, b, len(b), time()))
+        self.evict()
+        return summary
+
+    def evict(self):
+        """ removes the least recently used entries until the total size is below the maximum """
+        size = self.execute('SELECT TOTAL(size) FROM battles').fetchone()[0]
+        for key, s in self.execute('SELECT key, size FROM battles ORDER BY used').fetchall():
+            if size <= self.MaxSize:
+                break
+            self.execute('DELETE FROM battles WHERE key = ?', (key,))
+            size -= s
+
+    def clear(self):
+        self.execute('DELETE FROM battles')
+
+    def fight(self, attackers, defender: Army, n, runner: Runner = None, engine=None) -> Accumulator:
+        """ :returns the summary of at least n fights, only the trials missing in the cache are simulated """
+        engine = choose(engine, 'vectorized')
+        key, armies = self.key(attackers, defender, engine)
+        summary = self.get(key)
+        n_cached = 0 if summary is None else summary.n
+        if n_cached < n:
+            info(f'Simulating {int(n) - n_cached} fights ({n_cached} cached)')
+            summary = self.add(key, armies, choose(runner, Runner()).summarise(attackers, defender, int(n) - n_cached, engine))
+        return summary
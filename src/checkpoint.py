@@ -0,0 +1,43 @@
+import pickle
+from pathlib import Path
+from time import time
+
+from utils.helpers import info, warning
+
+
+class Checkpoint:
+    """ state of a long run which is saved at most every few seconds. The file is replaced atomically, so a crash never leaves a broken checkpoint.
+        The state is tagged with a key of the run, the checkpoint of another run is not resumed. """
+
+    def __init__(self, file_name, every=60):
+
+        self.FileName = Path(file_name)
+        self.Every = every  # minimum seconds between two saves
+        self.LastSave = time()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} in {self.FileName}'
+
+    def load(self, key):
+        """ :returns the saved state of the run with the given key or None """
+        if not self.FileName.exists():
+            return None
+        with open(self.FileName, 'rb') as f:
+            key_, state = pickle.load(f)
+        if key_ != key:
+            warning(f'{self.FileName} belongs to another run, starting from scratch')
+            return None
+        info(f'resuming from {self.FileName}')
+        return state
+
+    def save(self, key, state, force=False):
+        if force or time() - self.LastSave > self.Every:
+            self.FileName.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.FileName.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                pickle.dump((key, state), f)
+            tmp.replace(self.FileName)
+            self.LastSave = time()
+
+    def remove(self):
+        self.FileName.unlink(missing_ok=True)
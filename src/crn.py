@@ -0,0 +1,103 @@
+from copy import deepcopy
+from functools import lru_cache
+from zlib import crc32
+
+import numpy as np
+
+from src.army import Army
+from src.checkpoint import Checkpoint
+from src.runner import encode
+from src.simulation import FightSimulation, WaveSimulation
+from utils.helpers import choose
+
+
+@lru_cache(maxsize=None)
+def binomial_cdf(p, n_max):
+    """ :returns the cdfs of the binomial distributions with 0 to n_max trials with shape (n_max + 1, n_max + 1) """
+    pmf = np.zeros((n_max + 1, n_max + 1))
+    pmf[0, 0] = 1
+    for m in range(1, n_max + 1):
+        pmf[m] = pmf[m - 1] * (1 - p)
+        pmf[m, 1:] += pmf[m - 1, :-1] * p
+    cdf = np.cumsum(pmf, axis=1)
+    cdf[np.triu_indices(n_max + 1)] = 1  # no rounding beyond m successes
+    return cdf
+
+
+class Stream:
+    """ random stream of a battalion that can be antithetic (1 - u for all uniform draws).
+        Binomials are inverted from a single uniform per count, so a different number of units in one trial does not shift the draws of the other trials
+        and the antithetic stream is coupled to the same draws. """
+
+    def __init__(self, seed: np.random.SeedSequence, antithetic=False):
+
+        self.Rng = np.random.default_rng(seed)
+        self.Antithetic = antithetic
+
+    def random(self, size=None):
+        u = self.Rng.random(size)
+        return 1 - u if self.Antithetic else u
+
+    def binomial(self, n, p):
+        n = np.asarray(n)
+        if n.size == 0:
+            return n.copy()
+        u = self.random(n.shape)
+        return np.count_nonzero(u[..., None] > binomial_cdf(float(p), int(n.max()))[n], axis=-1).astype(n.dtype)
+
+
+class Comparison:
+    """ compares variants of the attacking armies against the same defender with common random numbers.
+        Every battalion draws from its own stream which only depends on the seed, the chunk of trials, the side and the unit type,
+        so variants that only differ in some unit counts start with the same draws. The draws stay aligned as long as the engine makes the same calls
+        for both variants; once the trials take different courses they drift apart, so the variance reduction is largest for small changes
+        and can be small for variants that fight differently. The trials of every variant are stored per chunk,
+        asking for more trials or comparing the same variant again only simulates the missing chunks. """
+
+    def __init__(self, defender: Army, seed=0, antithetic=False, chunk_size=1000, checkpoint: Checkpoint = None):
+
+        self.Defender = defender
+        self.Antithetic = antithetic  # every second chunk uses the antithetic streams of the previous one
+        self.ChunkSize = chunk_size
+        self.Checkpoint = checkpoint  # the chunks are saved and reloaded with the seed, they only depend on the seed
+        self.Key = (encode([defender]), seed, antithetic, chunk_size)  # a random seed (None) resumes with the seed of the checkpoint
+        state = None if checkpoint is None else checkpoint.load(self.Key)
+        self.Seed, self.Chunks = choose(state, (np.random.SeedSequence(seed).entropy, {}))  # variant -> list of the data of the simulated chunks
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} vs. {self.Defender} ({len(self.Chunks)} variants)'
+
+    def set_streams(self, armies, chunk):
+        c, anti = (chunk // 2, bool(chunk % 2)) if self.Antithetic else (chunk, False)
+        for side, army in enumerate(armies):
+            for bat in army:
+                bat.Rng = Stream(np.random.SeedSequence(self.Seed, spawn_key=(c, side, crc32(bat.Unit.Name.encode()))), anti)
+
+    def simulate(self, attackers, chunk):
+        """ :returns the data of the chunk of trials on copies of the armies """
+        attackers, defender = deepcopy((list(attackers), self.Defender))
+        self.set_streams([*attackers, defender], chunk)
+        return (FightSimulation(attackers[0], defender) if len(attackers) == 1 else WaveSimulation(attackers, defender)).run(self.ChunkSize)
+
+    def run(self, attackers, n):
+        """ :returns the data of n fights of the attackers, see Army.data """
+        attackers = attackers if type(attackers) in [list, tuple] else [attackers]
+        chunks = self.Chunks.setdefault(encode(attackers), [])
+        n_chunks = -(-int(n) // self.ChunkSize)
+        for i in range(len(chunks), n_chunks):
+            chunks.append(self.simulate(attackers, i))
+            if self.Checkpoint is not None:
+                self.Checkpoint.save(self.Key, (self.Seed, self.Chunks), force=i == n_chunks - 1)
+        return np.concatenate(chunks)[:int(n)]
+
+    def compare(self, variants, n):
+        """ :returns the data of n fights of all variants """
+        return [self.run(attackers, n) for attackers in variants]
+
+    def difference(self, a, b):
+        """ :returns the mean difference of all columns of the paired data and its standard error """
+        d = a - b
+        if self.Antithetic:  # average the antithetic pairs, they are not independent
+            k = d.shape[0] // (2 * self.ChunkSize) * 2 * self.ChunkSize
+            d = d[:k].reshape(-1, 2, self.ChunkSize, d.shape[1]).mean(1).reshape(-1, d.shape[1])
+        return d.mean(0), d.std(0, ddof=1) / np.sqrt(d.shape[0])
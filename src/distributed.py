@@ -0,0 +1,175 @@
+import asyncio
+import json
+import socket
+from base64 import b64decode, b64encode
+from collections import deque
+from itertools import product
+from time import sleep, time
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.army import Army, OwnArmy
+from src.runner import Engines, accumulate_chunk
+from src.scenario import army_spec, build_army
+from src.store import columns
+from utils.helpers import choose, info, warning
+
+
+class Coordinator:
+    """ distributes a sweep over compositions of the attacking army (see Sweep) to workers on other hosts over plain TCP.
+        The sweep is split into work units of (configuration, chunk of trials), each with its own seed, so the result does not depend on
+        which worker ran it. Units of workers that disconnect or do not answer within the timeout are handed out again. """
+
+    def __init__(self, defender: Army, army=OwnArmy, fixed: dict = None, n=1000, chunk_size=1000, seed=None, engine='vectorized', timeout=600, **grid):
+
+        self.Defender = army_spec(defender)
+        self.Axes = {key: np.asarray(values) for key, values in grid.items()}
+        self.Shape = tuple(v.size for v in self.Axes.values())
+        self.Configs = [{'army': army.__name__, **choose(fixed, {}), **dict(zip(self.Axes, map(int, values)))} for values in product(*self.Axes.values())]
+        self.Columns = [columns([build_army(c)]) for c in self.Configs]  # the attacker columns depend on the units of the configuration
+        used = set(sum(self.Columns, []))
+        self.AttackerColumns = [f'{unit.Name} losses' for unit in army.Units if f'{unit.Name} losses' in used] + ['Rounds']  # in the order of Sweep
+        self.DefenderColumns = columns([build_army(self.Defender)])
+        self.Engine = engine
+        self.Seed = np.random.SeedSequence(seed).entropy
+        self.Timeout = timeout  # seconds until the unit of a silent worker is handed out again
+
+        chunks = [min(chunk_size, n - i) for i in range(0, n, chunk_size)]
+        self.Units = {(i, j): m for i in range(len(self.Configs)) for j, m in enumerate(chunks)}  # (configuration, chunk) -> trials
+        self.Pending = deque(self.Units)
+        self.Leases = {}  # unit -> (worker, time)
+        self.Accs = [Accumulator() for _ in self.Configs]
+        self.NDone = 0
+        self.Finished = None
+
+    def __repr__(self):
+        axes = ' x '.join(f'{key} ({v.size})' for key, v in self.Axes.items())
+        return f'{self.__class__.__name__} of {axes} ({self.NDone}/{len(self.Units)} units done)'
+
+    # ----------------------------------------
+    # region WORK UNITS
+    def requeue(self, worker=None):
+        """ hands out the units of the worker (or all expired ones) again """
+        for unit, (w, t) in list(self.Leases.items()):
+            if w == worker or (worker is None and time() - t > self.Timeout):
+                warning(f'handing out unit {unit} again')
+                self.Leases.pop(unit)
+                self.Pending.appendleft(unit)
+
+    def next(self, worker):
+        """ :returns the message with the next unit for the worker """
+        self.requeue()
+        if self.NDone == len(self.Units):
+            return {'stop': True}
+        if not self.Pending:
+            return {'wait': min(1., self.Timeout)}
+        (i, j) = unit = self.Pending.popleft()
+        self.Leases[unit] = (worker, time())
+        return {'unit': unit, 'attackers': [self.Configs[i]], 'defender': self.Defender, 'n': self.Units[unit], 'seed': [self.Seed, i, j], 'engine': self.Engine}
+
+    def finish(self, unit, acc: Accumulator):
+        if unit in self.Leases or unit in self.Pending:  # results of units which were handed out twice are only merged once
+            self.Leases.pop(unit, None)
+            if unit in self.Pending:
+                self.Pending.remove(unit)
+            self.Accs[unit[0]].merge(acc)
+            self.NDone += 1
+            info(f'{self.NDone}/{len(self.Units)} units done', prnt=self.NDone % max(1, len(self.Units) // 20) == 0)
+            if self.NDone == len(self.Units):
+                self.Finished.set()
+    # endregion WORK UNITS
+    # ----------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ answers the requests of one worker until it disconnects """
+        worker = writer.get_extra_info('peername')
+        try:
+            while line := await reader.readline():
+                msg = json.loads(line)
+                if 'unit' in msg:
+                    self.finish(tuple(msg['unit']), Accumulator.from_bytes(b64decode(msg['acc'])))
+                writer.write(json.dumps(self.next(worker)).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, ValueError) as err:
+            warning(f'lost worker {worker}: {err!r}')
+        except asyncio.CancelledError:  # the sweep finished while the worker was busy
+            pass
+        finally:
+            self.requeue(worker)
+            writer.close()
+
+    async def serve(self, host='0.0.0.0', port=5555):
+        self.Finished = asyncio.Event()
+        server = await asyncio.start_server(self.handle, host, port)
+        info(f'{self!r} waiting for workers on {host}:{port}')
+        async with server:
+            await self.Finished.wait()
+
+    def run(self, host='0.0.0.0', port=5555):
+        """ :returns the mean of all columns with the shape (*grid, columns) """
+        asyncio.run(self.serve(host, port))
+        return self.mean()
+
+    @property
+    def columns(self):
+        """ :returns the names of the columns of all configurations, the attacker columns first and the defender columns last like in Sweep """
+        return self.AttackerColumns + self.DefenderColumns
+
+    def mean(self, name=None, defender=False):
+        """ :returns the means of all columns (or only of the attacker or defender column with the given name) on the grid,
+            unit types without units have 0 losses """
+        cols = self.AttackerColumns
+        means = np.array([[dict(zip(c, acc.mean()[:len(c)])).get(col, 0.) for col in cols] + acc.mean()[len(c):].tolist()
+                          for c, acc in zip(self.Columns, self.Accs)]).reshape(self.Shape + (-1,))
+        if name is None:
+            return means
+        return means[..., len(cols) + self.DefenderColumns.index(name)] if defender else means[..., cols.index(name)]
+
+
+class Worker:
+    """ asks the coordinator for work units, simulates them with the engines of the runner and sends back their summaries """
+
+    def __init__(self, host='localhost', port=5555, retry=10):
+
+        self.Host = host
+        self.Port = port
+        self.Retry = retry  # seconds to wait for the coordinator
+        self.NUnits = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {self.Host}:{self.Port}'
+
+    @staticmethod
+    def simulate(msg):
+        attackers, defender = [build_army(a) for a in msg['attackers']], build_army(msg['defender'])
+        seed = np.random.SeedSequence(msg['seed'][0], spawn_key=msg['seed'][1:])
+        return accumulate_chunk(Engines[msg['engine']], msg['n'], seed, msg['n'], (attackers, defender))[0]
+
+    def connect(self):
+        t = time()
+        while True:
+            try:
+                return socket.create_connection((self.Host, self.Port))
+            except ConnectionRefusedError:
+                if time() - t > self.Retry:
+                    raise
+                sleep(.5)
+
+    def run(self):
+        """ works until the coordinator stops it or goes away """
+        with self.connect() as s, s.makefile('rwb') as f:
+            msg = {}
+            while True:
+                f.write(json.dumps(msg).encode() + b'\n')
+                f.flush()
+                line = f.readline()
+                if not line or 'stop' in (msg := json.loads(line)):
+                    break
+                if 'wait' in msg:
+                    sleep(msg['wait'])
+                    msg = {}
+                    continue
+                msg = {'unit': msg['unit'], 'acc': b64encode(self.simulate(msg).to_bytes()).decode()}
+                self.NUnits += 1
+        return self.NUnits
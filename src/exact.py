@@ -0,0 +1,249 @@
+from collections import defaultdict
+from math import comb
+from time import perf_counter
+
+import numpy as np
+
+from src.army import Army, SpeedDict
+from src.battalion import Battalion
+from src.instrumentation import Stats
+
+
+class ExactSimulation:
+    """ exact outcome distribution of a fight, the probabilities of all states are propagated through the speed phases and rounds.
+        The state of an army is the number of alive units and the HP of the next alive unit of every battalion. """
+
+    Speeds = [2, 1, 0]
+
+    def __init__(self, attacker: Army, defender: Army, cutoff=1e-12, max_rounds=100, max_time=None):
+
+        self.Armies = [attacker, defender]
+        self.Cutoff = cutoff  # states with a smaller probability are dropped
+        self.MaxRounds = max_rounds
+        self.MaxTime = max_time  # seconds after which the run is given up
+        self.Deadline = None
+
+        self.MaxAttacks = max(bat.N for army in self.Armies for bat in army)
+        self.SpeedIndices = [{s: [i for i, bat in enumerate(army) if bat.Unit.Speed == s] for s in self.Speeds} for army in self.Armies]
+        self.Cache = {}
+        self.Result = None
+
+    # ----------------------------------------
+    # region STATE
+    @staticmethod
+    def init_state(army: Army):
+        return tuple((bat.N, bat.Unit.HP) for bat in army)
+
+    @staticmethod
+    def defeated(state):
+        return all(left == 0 for left, front in state)
+
+    @staticmethod
+    def order(army: Army, flanking):
+        return army.IHP if flanking else range(army.N)
+
+    @staticmethod
+    def stream(army: Army, state, order, dmg):
+        """ :returns the state after splash damage that spills over the alive units of the battalions in the given order """
+        state = list(state)
+        for i in order:
+            left, front = state[i]
+            if not left:
+                continue
+            hp = army[i].Unit.HP
+            if dmg < front:
+                state[i] = (left, front - dmg)
+                break
+            n = min(1 + (dmg - front) // hp, left)
+            dmg -= front + (n - 1) * hp
+            state[i] = (left - n, hp - dmg if n < left else hp)
+            if n < left or not dmg:
+                break
+        return tuple(state)
+
+    def check_time(self):
+        if self.Deadline is not None and perf_counter() > self.Deadline:
+            raise TimeoutError(f'exact simulation not finished within {self.MaxTime:.2f} s')
+
+    def prune(self, dist: dict):
+        return {s: p for s, p in dist.items() if p >= self.Cutoff}
+    # endregion STATE
+    # ----------------------------------------
+
+    # ----------------------------------------
+    # region ATTACK
+    @staticmethod
+    def dmg_probs(a: Battalion):
+        return [(a.Unit.DmgMax, a.P), (a.Unit.DmgMin, a.Q)] if a.Unit.DmgMax != a.Unit.DmgMin else [(a.Unit.DmgMax, 1)]
+
+    def splash_attack(self, a: Battalion, n, army: Army, state):
+        """ the damage of all units is a single binomial stream spilling over the enemy battalions """
+        dist, order = defaultdict(float), self.order(army, a.Unit.Flanking)
+        for k in range(n + 1):
+            dist[self.stream(army, state, order, k * a.Unit.DmgMax + (n - k) * a.Unit.DmgMin)] += comb(n, k) * a.P ** k * a.Q ** (n - k)
+        return dist
+
+    def single_attack(self, a: Battalion, n, army: Army, state):
+        """ attack unit by unit, each one either hits the next alive unit or splashes with probability a.Unit.Splash.
+            The battalions are attacked one after the other, so the units that are left over (and the excess splash damage) go to the next one. """
+        dist = {(state, n, 0): 1.}
+        for j in self.order(army, a.Unit.Flanking):
+            new = defaultdict(float)
+            for (state, m, carry), p in dist.items():
+                self.check_time()
+                left, front = state[j]
+                if carry and left:
+                    left, front, carry = self.take_splash(army[j].Unit.HP, left, front, carry)
+                if not m or not left:
+                    new[(state[:j] + ((left, front),) + state[j + 1:], m, carry)] += p
+                    continue
+                for (left, front, m_left, carry), q in self.battalion_attack(a, army[j].Unit.HP, left, front, m).items():
+                    new[(state[:j] + ((left, front),) + state[j + 1:], m_left, carry)] += p * q
+            dist = self.prune(new)
+        result = defaultdict(float)
+        for (state, m, carry), p in dist.items():
+            result[state] += p
+        return result
+
+    @staticmethod
+    def take_splash(hp, left, front, dmg):
+        """ :returns alive units, HP of the next unit and excess damage after a splash attack on a single battalion """
+        if dmg < front:
+            return left, front - dmg, 0
+        n = min(1 + (dmg - front) // hp, left)
+        dmg -= front + (n - 1) * hp
+        return (left - n, hp - dmg, 0) if n < left else (0, hp, dmg)
+
+    def battalion_attack(self, a: Battalion, hp, left, front, m):
+        """ :returns distribution of (alive units, HP of the next unit, attacks left over, excess splash damage) after m attacks on a single battalion """
+        key = ('battalion', a, hp, left, front, m)
+        if key not in self.Cache and a.Unit.Splash == 0:
+            dist, kills = self.kill_dist(a, hp, front)
+            self.Cache[key] = {(left - k, f, 0, 0): p for (k, f), p in dist[m].items() if k < left}
+            for t in np.flatnonzero(kills[left][:m]) if left in kills else []:
+                self.Cache[key][(0, hp, m - t - 1, 0)] = kills[left][t]
+        elif key not in self.Cache:
+            dist, done, s = {(left, front): 1.}, defaultdict(float), a.Unit.Splash
+            for t in range(m):
+                new = defaultdict(float)
+                self.check_time()
+                for (left, front), p in dist.items():
+                    for dmg, q in self.dmg_probs(a):
+                        for (left_, front_, carry), w in [(self.take_splash(hp, left, front, dmg), s), (self.hit(hp, left, front, dmg), 1 - s)]:
+                            if w > 0:
+                                if left_:
+                                    new[(left_, front_)] += p * q * w
+                                else:
+                                    done[(0, hp, m - t - 1, carry)] += p * q * w
+                dist = self.prune(new)
+            for (left, front), p in dist.items():
+                done[(left, front, 0, 0)] += p
+            self.Cache[key] = dict(done)
+        return self.Cache[key]
+
+    def kill_dist(self, a: Battalion, hp, front):
+        """ single target attacks on a battalion with unlimited units.
+            :returns the distributions of (kills, HP of the next unit) after every attack and the probabilities of the k-th kill happening with attack t """
+        key = ('kills', a, hp, front)
+        if key not in self.Cache:
+            dist, kills = [{(0, front): 1.}], defaultdict(lambda: np.zeros(self.MaxAttacks))
+            for t in range(self.MaxAttacks):
+                self.check_time()
+                new = defaultdict(float)
+                for (k, f), p in dist[-1].items():
+                    for dmg, q in self.dmg_probs(a):
+                        if dmg >= f:
+                            new[(k + 1, hp)] += p * q
+                            kills[k + 1][t] += p * q
+                        else:
+                            new[(k, f - dmg)] += p * q
+                dist.append(self.prune(new))
+            self.Cache[key] = dist, kills
+        return self.Cache[key]
+
+    @staticmethod
+    def hit(hp, left, front, dmg):
+        """ :returns alive units, HP of the next unit and excess damage after a single target attack on a battalion """
+        return (left - 1, hp, 0) if dmg >= front else (left, front - dmg, 0)
+
+    def attack(self, side, i, n, state):
+        """ :returns the distribution of the enemy state after the attack of battalion i with n units """
+        key = ('attack', side, i, n, state)
+        if key not in self.Cache:
+            a, army = self.Armies[side][i], self.Armies[1 - side]
+            if Stats.Enabled:
+                Stats.count('attack calls')
+            self.Cache[key] = (self.splash_attack if a.Unit.Splash == 1 else self.single_attack)(a, n, army, state)
+        return self.Cache[key]
+
+    def phase(self, side, speed, attacker_state, state):
+        """ :returns the distribution of the enemy state after all battalions of the given speed attacked with the alive units at the start of the phase """
+        n_alive = tuple(attacker_state[i][0] for i in self.SpeedIndices[side][speed])
+        key = ('phase', side, speed, n_alive, state)
+        if key not in self.Cache:
+            dist = {state: 1.}
+            for i, n in zip(self.SpeedIndices[side][speed], key[3]):
+                if n:
+                    new = defaultdict(float)
+                    for state, p in dist.items():
+                        self.check_time()
+                        for s, q in self.attack(side, i, n, state).items():
+                            new[s] += p * q
+                    dist = new
+            self.Cache[key] = dist
+        return self.Cache[key]
+    # endregion ATTACK
+    # ----------------------------------------
+
+    def outcome(self, a, d, n_rounds):
+        return tuple(np.concatenate([army.format_data(np.array([bat.N - left for bat, (left, front) in zip(army, state)]), n_rounds)
+                                     for army, state in zip(self.Armies, [a, d])]).tolist())
+
+    def run(self):
+        """ :returns dict of all outcomes (losses of both armies and the number of rounds in the format of Army.data) and their probabilities """
+        dist, result = {tuple(self.init_state(army) for army in self.Armies): 1.}, defaultdict(float)
+        self.Deadline = None if self.MaxTime is None else perf_counter() + self.MaxTime  # checked in all loops over states
+        for n_rounds in range(1, self.MaxRounds + 1):
+            for speed in [s for s in self.Speeds if self.SpeedIndices[0][s] or self.SpeedIndices[1][s]]:
+                t = perf_counter() if Stats.Enabled else 0
+                new = defaultdict(float)
+                for (a, d), p in dist.items():  # both attacks happen in parallel, so they are independent
+                    self.check_time()
+                    for d_new, q in self.phase(0, speed, a, d).items():
+                        for a_new, w in self.phase(1, speed, d, a).items():
+                            new[(a_new, d_new)] += p * q * w
+                dist = self.prune(new)
+                if Stats.Enabled:
+                    Stats.count('phases')
+                    Stats.count('states', len(dist))
+                    Stats.time(f'{SpeedDict[speed]} phase', perf_counter() - t)
+            if Stats.Enabled:
+                Stats.count('rounds')
+            for (a, d), p in list(dist.items()):
+                if self.defeated(a) or self.defeated(d):
+                    result[self.outcome(a, d, n_rounds)] += dist.pop((a, d))
+            if not dist:
+                break
+        self.Result = dict(result)
+        return self.Result
+
+    @property
+    def result(self):
+        return self.run() if self.Result is None else self.Result
+
+    @property
+    def lost(self):
+        """ :returns the probability that was dropped by the cutoff or did not finish within the maximum number of rounds """
+        return 1 - sum(self.result.values())
+
+    def distribution(self, i):
+        """ :returns the values and probabilities of the i-th outcome (column of Army.data) """
+        dist = defaultdict(float)
+        for outcome, p in self.result.items():
+            dist[outcome[i]] += p
+        x = np.array(sorted(dist))
+        return x, np.array([dist[v] for v in x])
+
+    def mean(self):
+        outcomes, p = np.array(list(self.result)), np.array(list(self.result.values()))
+        return p @ outcomes / p.sum()
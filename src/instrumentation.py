@@ -0,0 +1,65 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from threading import Lock
+
+
+class Instrumentation:
+    """ counters and timers of the combat engines.
+        The engines only update them if enabled, so the cost of the disabled instrumentation is a single attribute check.
+        The updates are locked, since the scenarios of the Runner are simulated in threads.
+        The counters of the object and vectorized engine are per trial: rounds, speed phases with alive units and attacks of a battalion with alive units
+        (the object engine counts an attack once per attacked battalion). The exact engine counts every computation once, whatever the probability of its states. """
+
+    def __init__(self):
+
+        self.Enabled = False
+        self.Counters = defaultdict(int)
+        self.Timers = defaultdict(float)  # seconds
+        self.Lock = Lock()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} ({"enabled" if self.Enabled else "disabled"})'
+
+    def __str__(self):
+        lines = [f'  {key}: {value}' for key, value in sorted(self.Counters.items())] + [f'  {key}: {value * 1e3:.1f} ms' for key, value in sorted(self.Timers.items())]
+        return 'Counters and timers:\n' + '\n'.join(lines)
+
+    def count(self, key, n=1):
+        with self.Lock:
+            self.Counters[key] += int(n)
+
+    def time(self, key, t):
+        with self.Lock:
+            self.Timers[key] += t
+
+    def reset(self):
+        with self.Lock:
+            self.Counters.clear()
+            self.Timers.clear()
+
+    @property
+    def summary(self):
+        with self.Lock:
+            return {'counters': dict(self.Counters), 'timers': dict(self.Timers)}
+
+    def merge(self, summary: dict):
+        """ adds the summary of another process """
+        for key, value in summary['counters'].items():
+            self.count(key, value)
+        for key, value in summary['timers'].items():
+            self.time(key, value)
+
+
+Stats = Instrumentation()
+
+
+@contextmanager
+def instrument():
+    """ enables the instrumentation for the enclosed simulations and yields the counters and timers (reset at the start) """
+    old = Stats.Enabled
+    Stats.reset()
+    Stats.Enabled = True
+    try:
+        yield Stats
+    finally:
+        Stats.Enabled = old
@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+import numpy as np
+import numpy.random as rnd
+
+from src.units import Unit
+
+
+class KillTable:
+    """ distribution of the kills and the HP of the next unit after m single target attacks of one unit type on another, for all m up to max_attacks.
+        Built once per (attacker, defender, HP of the first unit, battalion size) from the stat lines, sampling is a single search per trial. """
+
+    def __init__(self, attacker: Unit, defender: Unit, front, n_units, max_attacks):
+
+        self.Attacker = attacker
+        self.Defender = defender
+        self.K = n_units  # kills beyond the size of the battalion are absorbed
+        self.M = max_attacks
+
+        self.F = self.front_values(front)  # all reachable HP values of the next unit
+        self.CDF, self.Kills = self.build(front)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {self.Attacker.Name} vs. {self.Defender.Name} ({self.K} units, up to {self.M} attacks)'
+
+    @property
+    def dmgs(self):
+        a = self.Attacker
+        return [(a.DmgMax, a.Accuracy), (a.DmgMin, 1 - a.Accuracy)] if a.DmgMax != a.DmgMin else [(a.DmgMax, 1)]
+
+    def front_values(self, front):
+        values, new = {front, self.Defender.HP}, {front, self.Defender.HP}
+        while new:
+            new = {f - d for f in new for d, p in self.dmgs if f - d > 0} - values
+            values |= new
+        return np.array(sorted(values))
+
+    def build(self, front):
+        """ :returns the cdf of the flattened (kills, HP index) for every number of attacks (with offset 2m) and
+                     the cumulative probability that the k-th kill happened within t attacks (with offset 2k) """
+        n_f, i_hp = self.F.size, np.searchsorted(self.F, self.Defender.HP)
+        p, kills = np.zeros((self.K, n_f)), np.zeros((self.K + 1, self.M))
+        p[0, np.searchsorted(self.F, front)] = 1
+        rows = [p.ravel().copy()]
+        for t in range(self.M):
+            new = np.zeros_like(p)
+            for d, q in self.dmgs:
+                killed = self.F <= d
+                new[:, np.searchsorted(self.F, self.F[~killed] - d)] += q * p[:, ~killed]
+                k = q * p[:, killed].sum(1)  # probability of the (k + 1)-th kill with this attack
+                new[1:, i_hp] += k[:-1]
+                kills[1:, t] += k
+            p = new
+            rows.append(p.ravel().copy())
+        return np.cumsum(rows, axis=1) + 2 * np.arange(self.M + 1)[:, None], np.cumsum(kills, axis=1) + 2 * np.arange(self.K + 1)[:, None]
+
+    def sample(self, m, left, rng=None):
+        """ :param m: number of attacks of every trial
+            :param left: alive units of the battalion of every trial
+            :returns the kills, the HP of the next unit and the used attacks of every trial """
+        u = (rnd if rng is None else rng).random((2, m.size))
+        j = np.searchsorted(self.CDF.ravel(), u[0] + 2 * m, side='right') - m * self.CDF.shape[1]
+        k, front = np.minimum(j // self.F.size, self.K), self.F[np.minimum(j % self.F.size, self.F.size - 1)]
+        wiped = (k >= left) | (j >= self.CDF.shape[1])  # the left-th kill happened, time of the kill conditional on happening within m attacks
+        w = np.flatnonzero(wiped)
+        c = self.Kills[left[w], m[w] - 1] - 2 * left[w]
+        t = np.searchsorted(self.Kills.ravel(), u[1, w] * c + 2 * left[w], side='right') - left[w] * self.M
+        k[w], front[w] = left[w], self.Defender.HP
+        used = m.copy()
+        used[w] = t + 1
+        return k, front, used
+
+
+@lru_cache(maxsize=128)
+def kill_table(attacker: tuple, defender: tuple, front, n_units, max_attacks) -> KillTable:
+    """ cached kill table, the units are given by their stats """
+    return KillTable(Unit(*attacker), Unit(*defender), front, n_units, max_attacks)
+
+
+def set_cache_size(maxsize):
+    """ replaces the cache of the kill tables with an empty one of the given size, e.g. for long-lived workers """
+    global kill_table
+    kill_table = lru_cache(maxsize=maxsize)(kill_table.__wrapped__)
@@ -0,0 +1,103 @@
+from functools import lru_cache
+
+import numpy as np
+
+from src.army import Army
+from src.battalion import Battalion
+
+
+@lru_cache(maxsize=1024)
+def attacks_per_kill(dmgs: tuple, hp):
+    """ :param dmgs: pairs of damage and probability of a single target attack
+        :returns the expected number of attacks to kill a unit with the given HP, damage exceeding its HP is lost """
+    mu, mu2 = sum(d * p for d, p in dmgs), sum(d * d * p for d, p in dmgs)
+    if hp > 20 * max(d for d, p in dmgs):  # renewal approximation for bosses
+        return hp / mu + mu2 / (2 * mu * mu)
+    t = np.zeros(hp + 1)  # t[h]: expected attacks to kill a unit with h HP left
+    for h in range(1, hp + 1):
+        t[h] = 1 + sum(p * t[max(h - d, 0)] for d, p in dmgs)
+    return t[hp]
+
+
+class MeanFieldSimulation:
+    """ analytic approximation of the expected outcome of a fight. Every battalion is a continuous pool of HP which takes the expected damage of the
+        speed phases in the flanking order, the attacks of a battalion exceeding a pool carry over to the next one.
+        Single target attacks only count with the part of their damage that is needed to kill a unit, no random numbers are drawn. """
+
+    Speeds = [2, 1, 0]
+
+    def __init__(self, attackers, defender: Army, max_rounds=100):
+
+        self.Attackers = list(attackers) if type(attackers) in [list, tuple] else [attackers]
+        self.Defender = defender
+        self.MaxRounds = max_rounds
+        self.Result = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {", ".join(str(a) for a in self.Attackers)} vs. {self.Defender}'
+
+    # ----------------------------------------
+    # region ATTACK
+    @staticmethod
+    def dmgs(a: Battalion):
+        return ((a.Unit.DmgMax, a.P), (a.Unit.DmgMin, a.Q)) if a.Unit.DmgMax != a.Unit.DmgMin else ((a.Unit.DmgMax, 1.),)
+
+    @staticmethod
+    def eff_dmg(a: Battalion, hp):
+        """ :returns the expected damage of one attack on units with the given HP """
+        dmgs = MeanFieldSimulation.dmgs(a)
+        splash = sum(d * p for d, p in dmgs)
+        return splash if a.Unit.Splash == 1 else a.Unit.Splash * splash + (1 - a.Unit.Splash) * hp / attacks_per_kill(dmgs, hp)
+
+    @staticmethod
+    def n_alive(army: Army, pool):
+        """ :returns the alive units of all battalions, a wounded unit still attacks """
+        return np.ceil(pool / [bat.Unit.HP for bat in army] - 1e-9)
+
+    @staticmethod
+    def attack(a: Battalion, n, army: Army, pool):
+        """ attack of n units on the HP pools of the enemy battalions """
+        for i in army.IHP if a.Unit.Flanking else range(army.N):
+            if n <= 0:
+                break
+            if pool[i] > 0:
+                e = MeanFieldSimulation.eff_dmg(a, army[i].Unit.HP)
+                dmg = min(n * e, pool[i])
+                pool[i] -= dmg
+                n -= dmg / e
+
+    def round(self, attacker: Army, defender: Army, pools):
+        for speed in self.Speeds:
+            n = [self.n_alive(army, pool) for army, pool in zip([attacker, defender], pools)]  # both attacks happen in parallel
+            for side, (army, enemy) in enumerate([(attacker, defender), (defender, attacker)]):
+                for i, bat in enumerate(army):
+                    if bat.Unit.Speed == speed and n[side][i] > 0:
+                        self.attack(bat, n[side][i], enemy, pools[1 - side])
+    # endregion ATTACK
+    # ----------------------------------------
+
+    def fight(self, attacker: Army, pools):
+        """ :returns the number of rounds until one of the armies is defeated """
+        for n_rounds in range(1, self.MaxRounds + 1):
+            self.round(attacker, self.Defender, pools)
+            if any(np.all(pool < 1e-6) for pool in pools):
+                return n_rounds
+        return self.MaxRounds
+
+    def losses(self, army: Army, pool):
+        return np.array([bat.N for bat in army]) - self.n_alive(army, pool)
+
+    def run(self):
+        """ :returns the approximate losses of all armies and the number of rounds of every wave in the format of Army.data (of a single trial) """
+        d, data, n_rounds = np.array([bat.N * bat.Unit.HP for bat in self.Defender], 'd'), [], 0
+        for army in self.Attackers:
+            a, rounds = np.array([bat.N * bat.Unit.HP for bat in army], 'd'), 0
+            if np.any(d >= 1e-6):
+                rounds = self.fight(army, [a, d])
+            data.append(army.format_data(self.losses(army, a), rounds))
+            n_rounds += rounds
+        self.Result = np.concatenate(data + [self.Defender.format_data(self.losses(self.Defender, d), n_rounds)])
+        return self.Result
+
+    def mean(self):
+        return self.run() if self.Result is None else self.Result
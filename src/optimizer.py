@@ -0,0 +1,110 @@
+from itertools import combinations
+
+import numpy as np
+
+from src.army import Army, OwnArmy
+from src.mean_field import MeanFieldSimulation
+from src.runner import Runner
+from utils.helpers import choose, info
+
+
+class Optimizer:
+    """ searches the unit counts of an OwnArmy that minimise the expected (or a quantile of the) losses against an enemy.
+        Candidates are raced with successive halving: all of them get a few trials, only the best 1/eta get more.
+        Optionally, only the best fraction keep of the candidates by the mean field approximation enter the race. """
+
+    Units = OwnArmy.Units[:-1]  # the General is always included
+
+    def __init__(self, enemy: Army, units=None, max_units=200, q=None, eta=3, n0=16, runner: Runner = None, keep=None):
+
+        self.Enemy = enemy
+        self.IUnits = choose(units, range(len(self.Units)))  # indices of the used unit types
+        self.MaxUnits = max_units
+        self.Q = q  # quantile of the losses, the mean if None
+        self.Eta = eta
+        self.N0 = n0  # trials of the first stage
+        self.Runner = choose(runner, Runner(1))
+        self.Keep = keep  # fraction of the candidates that pass the mean field filter, all if None
+
+        self.Losses = {}  # total losses of all trials of the evaluated candidates
+        self.NTrials = 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {", ".join(self.Units[i].Name for i in self.IUnits)} vs. {self.Enemy}'
+
+    # ----------------------------------------
+    # region CANDIDATES
+    def candidates(self, step):
+        """ :returns all compositions with multiples of step units that fill the capacity """
+        k, n = len(self.IUnits), self.MaxUnits // step
+        bars = np.array(list(combinations(range(n + k - 1), k - 1))).reshape(-1, k - 1)
+        return step * np.diff(np.hstack([np.full((bars.shape[0], 1), -1), bars, np.full((bars.shape[0], 1), n + k - 1)]), axis=1) - step
+
+    @staticmethod
+    def neighbours(x, step):
+        """ :returns the compositions where step units of one type are replaced by another type """
+        moves = [(i, j) for i in range(x.size) for j in range(x.size) if i != j and x[i] >= step]
+        return np.array([x + step * (np.arange(x.size) == j) - step * (np.arange(x.size) == i) for i, j in moves]).reshape(-1, x.size)
+
+    def army(self, x) -> OwnArmy:
+        n = np.zeros(len(self.Units), 'i')
+        n[list(self.IUnits)] = x
+        return OwnArmy(*n.tolist())
+    # endregion CANDIDATES
+    # ----------------------------------------
+
+    # ----------------------------------------
+    # region EVALUATION
+    def evaluate(self, x, n):
+        """ tops up the trials of the composition x to n.
+            :returns the total losses of the trials """
+        key = tuple(x.tolist())
+        losses = self.Losses.get(key, np.empty(0, 'i'))
+        if losses.size < n:
+            army = self.army(x)
+            data = self.Runner.fight([army], self.Enemy, n - losses.size)
+            self.NTrials += data.shape[0]
+            self.Losses[key] = losses = np.append(losses, data[:, :army.N - 1].sum(1))  # without the General
+        return losses[:n]
+
+    def approximate(self, x):
+        """ :returns the approximate mean losses of the composition x from the mean field """
+        army = self.army(x)
+        return MeanFieldSimulation(army, self.Enemy).run()[:army.N - 1].sum()
+
+    def prefilter(self, candidates):
+        """ :returns the best fraction keep of the candidates by their approximate losses """
+        if self.Keep is None:
+            return candidates
+        scores = np.array([self.approximate(x) for x in candidates])
+        return candidates[np.argsort(scores, kind='stable')[:max(1, int(np.ceil(self.Keep * candidates.shape[0])))]]
+
+    def score(self, losses):
+        return losses.mean() if self.Q is None else np.quantile(losses, self.Q)
+
+    def race(self, candidates, n_max=4096):
+        """ successive halving: keeps the best 1/eta of the candidates and multiplies the trials by eta until one is left.
+            :returns the best candidate """
+        n = self.N0
+        while candidates.shape[0] > 1 and n <= n_max:
+            scores = np.array([self.score(self.evaluate(x, n)) for x in candidates])
+            candidates = candidates[np.argsort(scores, kind='stable')[:max(1, -(-candidates.shape[0] // self.Eta))]]
+            n *= self.Eta
+        return candidates[0]
+    # endregion EVALUATION
+    # ----------------------------------------
+
+    def run(self, step=40, min_step=1, n_max=4096):
+        """ races all compositions with multiples of step units, then refines the best one by moving units between the types with halving steps.
+            :returns the best army """
+        best = self.race(self.prefilter(self.candidates(step)), n_max)
+        visited = {tuple(best.tolist())}
+        while step >= min_step:
+            best = self.race(np.vstack([best, self.neighbours(best, step)]), n_max)
+            if tuple(best.tolist()) in visited:  # no improvement
+                step //= 2
+            visited.add(tuple(best.tolist()))
+        army = self.army(best)
+        info(f'Best army after {self.NTrials} trials: {army!r}')
+        info(f'Losses: {self.score(self.evaluate(best, n_max)):.1f}')
+        return army
@@ -0,0 +1,117 @@
+from copy import deepcopy
+from statistics import NormalDist
+
+import numpy as np
+
+from src.army import Army
+from src.simulation import FightSimulation, WaveSimulation
+from utils.helpers import choose, info, warning
+
+
+def losses(i, k=1):
+    """ :returns event of at least k losses in column i of the data (see Army.data), e.g. losing the general """
+    return lambda data: data[:, i] >= k
+
+
+def log_ratio(draws, n):
+    """ :returns the log likelihood ratio of the nominal to the biased stats for the draws of n trials, see FightSimulation.Draws """
+    w = np.zeros(n)
+    for (bat, stat), (k, m) in draws.items():
+        p, q = getattr(bat.Nominal, stat), getattr(bat.Unit, stat)
+        w += k * np.log(p / q) + m * np.log((1 - p) / (1 - q))
+    return w
+
+
+class RareEvent:
+    """ importance sampling of rare outcomes of the fights with the vectorized engine. The accuracies (and partial splash chances) of the attacking units
+        are shifted down by the tilt and those of the defender up, so bad outcomes of the attackers become common. Every trial is weighted with the
+        likelihood ratio of its draws, which keeps the estimated probability unbiased. The biases of the single battalions can be refined with the
+        cross-entropy method, see refine. """
+
+    def __init__(self, attackers, defender: Army, event, tilt=.05, seed=None):
+
+        self.Attackers = [attackers] if isinstance(attackers, Army) else list(attackers)  # one army or several attacking one after the other
+        self.Defender = defender
+        self.Event = event  # function of the data of the trials returning True for the trials with the outcome
+        self.Tilt = tilt
+        self.Biases = {}  # (army, battalion, stat) -> biased probability, overrides the tilt
+        self.Rng = np.random.default_rng(seed)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {len(self.Attackers)} armies vs. {self.Defender} (tilt {self.Tilt:.3f}, {len(self.Biases)} refined biases)'
+
+    @staticmethod
+    def biasable(u, stat):
+        """ :returns whether the draws of the stat change the outcome """
+        return 0 < getattr(u, stat) < 1 and (stat == 'Splash' or u.DmgMin != u.DmgMax)
+
+    def bias(self, army: Army, i, t):
+        """ :returns a copy of army i with the accuracy and partial splash chance of all units shifted by t (or set to the refined biases) """
+        army = deepcopy(army)
+        for j, bat in enumerate(army):
+            u = bat.Unit
+            acc, splash = [self.Biases.get((i, j, stat), float(np.clip(getattr(u, stat) + t, .02, .98))) if self.biasable(u, stat) else getattr(u, stat)
+                           for stat in ['Accuracy', 'Splash']]
+            if (acc, splash) != (u.Accuracy, u.Splash):
+                bat.set_unit(u.replace(acc, splash))
+                bat.Nominal = u
+        return army
+
+    def simulate(self, n, tilt=None):
+        """ :returns the data of n biased trials, the draws of the biased battalions and the biased armies """
+        t = choose(tilt, self.Tilt)
+        armies = [self.bias(army, i, -t) for i, army in enumerate(self.Attackers)] + [self.bias(self.Defender, len(self.Attackers), t)]
+        for army in armies:
+            army.set_rng(self.Rng)
+        sim = FightSimulation(armies[0], armies[-1]) if len(armies) == 2 else WaveSimulation(armies[:-1], armies[-1])
+        return sim.run(n), sim.Draws, armies
+
+    def sample(self, n, tilt=None):
+        """ :returns the data and the likelihood ratios of n biased trials """
+        data, draws, armies = self.simulate(int(n), tilt)
+        return data, np.exp(log_ratio(draws, int(n)))
+
+    def estimate(self, n, tilt=None, cl=.95):
+        """ :returns the probability of the event, its standard error and confidence interval from n biased trials """
+        return self.weigh(*self.sample(n, tilt), cl)
+
+    def weigh(self, data, w, cl=.95):
+        """ :returns the probability of the event, its standard error and confidence interval from the weighted trials """
+        x = w * self.Event(data)
+        p, se = x.mean(), x.std(ddof=1) / np.sqrt(x.size)
+        z = NormalDist().inv_cdf((1 + cl) / 2)
+        return p, se, (max(p - z * se, 0.), p + z * se)
+
+    def tune(self, n=2000, tilts=np.arange(0, .41, .025), max_spread=3):
+        """ sets the tilt with the smallest relative error in pilot runs of n trials. Strong tilts make a few trials carry all the weight,
+            which hides the error, so tilts with a spread (std) of the log likelihood ratios above max_spread are not used.
+            :returns the tilt """
+        errors = []
+        for t in tilts:
+            data, w = self.sample(n, t)
+            p, se, ci = self.weigh(data, w)
+            errors.append(se / p if p > 0 and np.log(w).std() <= max_spread else np.inf)
+        if np.all(np.isinf(errors)):
+            warning(f'no pilot run has trials with the event, keeping the tilt {self.Tilt:.3f}')
+            return self.Tilt
+        self.Tilt = float(tilts[int(np.argmin(errors))])
+        info(f'best tilt {self.Tilt:.3f} with a relative error of {min(errors):.1%} after {n} trials')
+        return self.Tilt
+
+    def refine(self, n=5000, iterations=3, smooth=.7):
+        """ cross-entropy method: sets the bias of every battalion to the weighted fraction of successes of its draws in the trials with the event.
+            Battalions that do not matter for the event move back to their nominal stats, which removes their noise from the weights.
+            :returns the biases """
+        for _ in range(iterations):
+            data, draws, armies = self.simulate(int(n))
+            v = np.exp(log_ratio(draws, int(n))) * self.Event(data)
+            if not np.any(v):
+                warning('no trials with the event, increase the tilt (see tune)')
+                break
+            ids = {id(bat): (i, j) for i, army in enumerate(armies) for j, bat in enumerate(army)}
+            for (bat, stat), (k, m) in draws.items():
+                if not np.any(v * (k + m)):  # no draws in the trials with the event
+                    continue
+                q = np.sum(v * k) / np.sum(v * (k + m))
+                self.Biases[ids[id(bat)] + (stat,)] = float(np.clip(smooth * q + (1 - smooth) * getattr(bat.Unit, stat), .02, .98))
+        return self.Biases
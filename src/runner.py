@@ -0,0 +1,224 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from copy import deepcopy
+from multiprocessing import Pool, cpu_count, shared_memory
+from statistics import NormalDist
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.army import Army
+from src.battalion import Battalion
+from src.checkpoint import Checkpoint
+from src.instrumentation import Stats
+from src.simulation import FightSimulation, WaveSimulation
+from utils.helpers import choose, info, warning
+
+DType = np.dtype('i')
+
+
+# ----------------------------------------
+# region ENGINES
+def n_cols(attackers, defender: Army):
+    """ :returns the number of columns of the data of a fight """
+    return sum(army.data.size for army in [*attackers, defender])
+
+
+def fight_objects(n, rng, attackers, defender: Army):
+    """ object engine: the attackers fight the defender one after the other in every trial """
+    attackers, defender = deepcopy((list(attackers), defender))  # the rng and the state of the armies of the caller are not touched
+    for army in [*attackers, defender]:
+        army.set_rng(rng)
+    data = np.empty((n, n_cols(attackers, defender)), DType)
+    for i in range(n):
+        defender.revive()
+        for army in attackers:
+            army.revive()
+            army.attack(defender)
+        data[i] = np.concatenate([army.data for army in [*attackers, defender]])
+    return data
+
+
+def fight_vectorized(n, rng, attackers, defender: Army):
+    """ vectorized engine, several attackers attack in waves """
+    attackers, defender = deepcopy((list(attackers), defender))
+    for army in [*attackers, defender]:
+        army.set_rng(rng)
+    return (FightSimulation(attackers[0], defender) if len(attackers) == 1 else WaveSimulation(attackers, defender)).run(n)
+
+
+def one_round(n, rng, attacker: Battalion, defender: Battalion):
+    """ losses of the defender after a single attack of the battalion in every trial """
+    attacker, defender = deepcopy((attacker, defender))
+    attacker.Rng = defender.Rng = rng
+    data = np.empty((n, 1), DType)
+    for i in range(n):
+        attacker.revive()
+        defender.revive()
+        attacker._attack(defender)
+        attacker.end_attack()
+        data[i] = defender.N - defender.n_alive
+    return data
+
+
+Engines = {'object': fight_objects, 'vectorized': fight_vectorized}
+# endregion ENGINES
+# ----------------------------------------
+
+
+def run_chunk(f, name, shape, start, stop, seed: np.random.SeedSequence, args, instrumented=None):
+    """ runs the trials [start, stop) with an independent random stream and writes them into the shared memory.
+        :returns the counters and timers of a worker process if instrumented """
+    if instrumented is not None:  # in a worker
+        Stats.Enabled = instrumented
+        Stats.reset()
+    shm = shared_memory.SharedMemory(name)
+    data = np.ndarray(shape, DType, shm.buf)
+    data[start:stop] = f(stop - start, np.random.default_rng(seed), *args)
+    del data
+    shm.close()
+    return Stats.summary if instrumented else None
+
+
+def run_scenario(f, n, seed: np.random.SeedSequence, attackers, defender: Army):
+    """ runs n fights, the engines work on private copies of the armies and share the unit catalog """
+    return f(n, np.random.default_rng(seed), attackers, defender)
+
+
+def accumulate_chunk(f, n, seed: np.random.SeedSequence, batch_size, args, instrumented=None):
+    """ runs n trials in batches and only keeps their summary.
+        :returns the accumulator and the counters and timers of a worker process if instrumented """
+    if instrumented is not None:
+        Stats.Enabled = instrumented
+        Stats.reset()
+    acc, rng = Accumulator(), np.random.default_rng(seed)
+    for i in range(0, n, batch_size):
+        acc.add(f(min(batch_size, n - i), rng, *args))
+    return acc, Stats.summary if instrumented else None
+
+
+def accumulate_task(task):
+    return accumulate_chunk(*task)
+
+
+def encode(armies):
+    """ :returns the type and the counts and stats of all battalions of the armies """
+    return tuple((army.__class__.__name__, tuple((bat.N, bat.Unit.stats) for bat in army)) for army in armies)
+
+
+class Runner:
+    """ runs the trials of a simulation in chunks on a process pool.
+        Every chunk gets its own seeded random stream and writes its results straight into shared memory. """
+
+    def __init__(self, n_workers=None, chunk_size=None, seed=None):
+
+        self.NWorkers = choose(n_workers, cpu_count())
+        self.ChunkSize = chunk_size  # one chunk per worker if None
+        self.Seed = np.random.SeedSequence(seed)
+        self.Fixed = seed is not None  # the checkpoints of a random seed are resumed with their own seeds
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} with {self.NWorkers} workers'
+
+    def state(self, n):
+        """ :returns the json state from which run reproduces the next n trials: the seed sequence before spawning the seeds of the chunks and their sizes """
+        return {'entropy': self.Seed.entropy, 'spawn_key': list(self.Seed.spawn_key), 'n_children_spawned': self.Seed.n_children_spawned,
+                'chunks': [stop - start for start, stop in self.chunks(n)]}
+
+    def chunks(self, n):
+        size = max(choose(self.ChunkSize, -(-n // self.NWorkers)), 1)
+        return [(i, min(i + size, n)) for i in range(0, n, size)]
+
+    def run(self, f, n, n_cols, *args):
+        """ :returns the results of f(n_chunk, rng, *args) for n trials with shape (n, n_cols) """
+        n = int(n)
+        shm = shared_memory.SharedMemory(create=True, size=max(n * n_cols * DType.itemsize, 1))
+        try:
+            chunks = self.chunks(n)
+            tasks = [(f, shm.name, (n, n_cols), *chunk, seed, args) for chunk, seed in zip(chunks, self.Seed.spawn(len(chunks)))]
+            if self.NWorkers > 1 and len(tasks) > 1:
+                with Pool(min(self.NWorkers, len(tasks))) as pool:
+                    for summary in pool.starmap(run_chunk, [task + (Stats.Enabled,) for task in tasks]):
+                        if summary is not None:
+                            Stats.merge(summary)
+            else:
+                for task in tasks:
+                    run_chunk(*task)
+            return np.ndarray((n, n_cols), DType, shm.buf).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def fight(self, attackers, defender: Army, n, engine=None):
+        """ :returns the data of n fights of the attackers (one after the other) against the defender, see Army.data """
+        engine = choose(engine, 'vectorized')
+        return self.run(Engines[engine], n, n_cols(attackers, defender), list(attackers), defender)
+
+    def stream(self, attackers, defender: Army, n, store, engine=None, batch_size=1e6):
+        """ runs n fights in batches and appends the data of every batch with the engine and seed state that reproduce it to the store (e.g. a Campaign),
+            only one batch is kept in memory """
+        n, batch_size = int(n), int(batch_size)
+        for i in range(0, n, batch_size):
+            m = min(batch_size, n - i)
+            state = {'engine': choose(engine, 'vectorized'), **self.state(m)}
+            store.append(self.fight(attackers, defender, m, engine), state)
+            info(f'{min(i + batch_size, n)}/{n} trials', prnt=n > batch_size)
+        return store
+
+    def summarise(self, attackers, defender: Army, n, engine=None, batch_size=100000, checkpoint: Checkpoint = None) -> Accumulator:
+        """ :returns the summary of n fights in constant memory, every worker accumulates its chunk in batches.
+            With a checkpoint every chunk is a single batch, the summaries of the finished chunks and the seeds of all chunks are saved,
+            so an interrupted run resumes with the identical result """
+        f, n, batch_size = Engines[choose(engine, 'vectorized')], int(n), int(batch_size)
+        chunks = self.chunks(n) if checkpoint is None else [(i, min(i + batch_size, n)) for i in range(0, n, batch_size)]
+        key = (encode([*attackers, defender]), n, batch_size, f.__name__, self.Seed.entropy if self.Fixed else None)
+        state = (None if checkpoint is None else checkpoint.load(key)) or {'seeds': self.Seed.spawn(len(chunks)), 'done': {}}
+        todo = [i for i in range(len(chunks)) if i not in state['done']]
+        tasks = [(f, chunks[i][1] - chunks[i][0], state['seeds'][i], batch_size, (list(attackers), defender)) for i in todo]
+        with Pool(min(self.NWorkers, len(tasks))) if self.NWorkers > 1 and len(tasks) > 1 else nullcontext() as pool:
+            results = (accumulate_chunk(*task) for task in tasks) if pool is None else pool.imap(accumulate_task, [task + (Stats.Enabled,) for task in tasks])
+            for i, (a, summary) in zip(todo, results):
+                state['done'][i] = a
+                if summary is not None:
+                    Stats.merge(summary)
+                if checkpoint is not None:
+                    checkpoint.save(key, state, force=len(state['done']) == len(chunks))
+        acc = Accumulator(n_cols(attackers, defender))
+        for i in range(len(chunks)):  # always merged in the same order
+            acc.merge(state['done'][i])
+        return acc
+
+    def scenarios(self, scenarios, n, engine=None):
+        """ runs n fights of all (attackers, defender) scenarios concurrently on a thread pool in this process.
+            :returns list of the data of every scenario """
+        tasks = [(Engines[choose(engine, 'vectorized')], int(n), seed, a, d) for (a, d), seed in zip(scenarios, self.Seed.spawn(len(scenarios)))]
+        with ThreadPoolExecutor(self.NWorkers) as pool:
+            return list(pool.map(lambda task: run_scenario(*task), tasks))
+
+    def adaptive(self, attackers, defender: Army, width=.5, q=None, cl=.95, batch=1000, max_n=1e6, engine=None):
+        """ runs fights in growing batches until the confidence intervals of the means (or of the quantiles q) of all columns are narrower than width.
+            :returns the data of all fights, see Army.data """
+        data, max_n = np.empty((0, n_cols(attackers, defender)), DType), int(max_n)
+        while data.shape[0] < max_n:
+            data = np.concatenate([data, self.fight(attackers, defender, min(batch, max_n - data.shape[0]), engine)])
+            if np.max(self.ci_width(data, q, cl)) < width:
+                info(f'Converged after {data.shape[0]} trials')
+                break
+            batch = data.shape[0]  # double the number of trials
+        else:
+            warning(f'Not converged after the maximum of {max_n} trials')
+        return data
+
+    @staticmethod
+    def ci_width(data, q=None, cl=.95):
+        """ :returns the width of the confidence interval of the mean or the largest one of the quantiles q for every column """
+        z, n = NormalDist().inv_cdf((1 + cl) / 2), data.shape[0]
+        if n < 2:
+            return np.full(data.shape[1], np.inf)
+        if q is None:
+            return 2 * z * data.std(0, ddof=1) / np.sqrt(n)
+        q = np.atleast_1d(q)
+        d = z * np.sqrt(n * q * (1 - q))  # order statistics of the binomial confidence interval
+        lo, hi = [np.clip(np.round(n * q + s * d).astype('i'), 0, n - 1) for s in [-1, 1]]
+        x = np.sort(data, axis=0)
+        return np.max(x[hi] - x[lo], axis=0)
@@ -0,0 +1,79 @@
+from functools import partial
+from inspect import signature
+
+from src.army import Army, OwnArmy, EnemyArmy, DeserterArmy
+from src.boss import Skunk, OneEyedBert, MetalTooth, Chuck, WildMary, Bosses
+
+Armies = {cls.__name__: cls for cls in [OwnArmy, EnemyArmy, DeserterArmy]}
+
+
+def build_army(spec: dict) -> Army:
+    """ :param spec: army type and unit counts with an optional boss in front, e.g. {"army": "EnemyArmy", "roughnecks": 100, "boss": "Chuck"} """
+    spec = dict(spec)
+    army, boss = Armies[spec.pop('army', 'OwnArmy')], spec.pop('boss', None)
+    return army(**spec) if boss is None else Bosses[boss] + army(**spec)
+
+
+def army_spec(army: Army) -> dict:
+    """ :returns the spec of the army for build_army, overridden stats are not included """
+    counts = {name: 0 for name in list(signature(army.__class__.__init__).parameters)[1:]}
+    counts.update({name: bat.N for name, unit in zip(counts, army.Units) for bat in army if bat.Unit.Name == unit.Name})
+    boss = [bat.Unit.Name for bat in army if bat.Unit.Name in Bosses]
+    return {'army': army.__class__.__name__, **counts, **({'boss': boss[0]} if boss else {})}
+
+
+class Scenario:
+    """ named fight of one or more armies (one after the other) against a defender.
+        The armies are built anew on every call, so scenarios never share any state. """
+
+    def __init__(self, name, attackers, defender):
+
+        self.Name = name
+        self.Attackers = attackers  # functions returning the attacking armies
+        self.Defender = defender
+
+    def __repr__(self):
+        attackers, defender = self.armies()
+        return f'{self.Name}: {", ".join(f"{a!r}" for a in attackers)} vs. {defender!r}'
+
+    def armies(self) -> (list, Army):
+        return [f() for f in self.Attackers], self.Defender()
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'Scenario':
+        """ :param spec: the name of one of the Scenarios ({"scenario": "camp1"}) or a name, the attacking armies and the defender, see build_army """
+        if 'scenario' in spec:
+            return Scenarios[spec['scenario']]
+        return cls(spec['name'], [partial(build_army, a) for a in spec['attackers']], partial(build_army, spec['defender']))
+
+
+def chuck_camp():
+    return Chuck + EnemyArmy(0, 0, 50, 100, 0, 49)
+
+
+def camp1():
+    return EnemyArmy(0, 150, 30, 0, 0, 20)
+
+
+def large_camp():
+    return EnemyArmy(40, 40, 30, 40, 30, 20)
+
+
+Scenarios = {s.Name: s for s in [
+    # armies of main.py
+    Scenario('recruits', [lambda: OwnArmy(200)], chuck_camp),
+    Scenario('bm', [lambda: OwnArmy(bowmen=200)], chuck_camp),
+    Scenario('lb', [lambda: OwnArmy(longbowmen=200)], chuck_camp),
+    Scenario('me', [lambda: OwnArmy(1, 0, 0, 165)], chuck_camp),
+    Scenario('camp1', [lambda: OwnArmy(0, 0, 100, 0, 0, 50)], camp1),
+    # bosses
+    Scenario('skunk', [lambda: OwnArmy(0, 0, 150, 49)], lambda: Skunk + EnemyArmy(10)),
+    Scenario('one-eyed-bert', [lambda: OwnArmy(0, 0, 150, 49)], lambda: OneEyedBert + EnemyArmy(0, 20, 0, 0, 20)),
+    Scenario('metal-tooth', [lambda: OwnArmy(1, 0, 0, 199), lambda: OwnArmy(0, 0, 120, 0, 0, 79)], lambda: MetalTooth + EnemyArmy(0, 0, 40, 40, 0, 20)),
+    Scenario('chuck', [lambda: OwnArmy(1, 0, 0, 100), lambda: OwnArmy(1, 0, 0, 100), lambda: OwnArmy(0, 0, 150, 49)], chuck_camp),
+    Scenario('wild-mary', [lambda: OwnArmy(recruits=199), lambda: OwnArmy(0, 0, 100, 0, 0, 99)], lambda: WildMary + EnemyArmy(0, 0, 0, 50, 0, 50)),
+    # large camps
+    Scenario('large', [lambda: OwnArmy(0, 20, 80, 20, 20, 59)], large_camp),
+    Scenario('large-waves', [lambda: OwnArmy(0, 0, 120, 0, 0, 79), lambda: OwnArmy(0, 0, 120, 0, 0, 79), lambda: OwnArmy(20, 20, 100, 0, 20, 39)], large_camp),
+    Scenario('deserters', [lambda: OwnArmy(0, 0, 100, 0, 40, 59)], lambda: DeserterArmy(30, 30, 20, 30, 20, 20)),
+]}
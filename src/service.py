@@ -0,0 +1,205 @@
+import asyncio
+import json
+import socket
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import aclosing
+from multiprocessing import cpu_count
+from pathlib import Path
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.cache import BattleCache
+from src.kill_table import set_cache_size
+from src.runner import Engines, accumulate_chunk
+from src.scenario import Scenario, Scenarios
+from src.store import columns
+from utils.helpers import Dir, choose, info, warning
+
+
+def init_worker(n_tables, warm=False, n=100):
+    """ imports the simulation code and limits the kill tables of a worker to n_tables, if warm they are filled with the tables of the standard scenarios,
+        otherwise every table is built on its first use """
+    set_cache_size(n_tables)
+    if warm:
+        for s in Scenarios.values():
+            Engines['vectorized'](n, np.random.default_rng(), *s.armies())
+
+
+def message(acc: Accumulator, cols, done, cached=False):
+    return {'n': acc.n, 'columns': cols, 'mean': acc.mean().tolist(), 'std': np.nan_to_num(acc.std()).tolist(), 'done': done, 'cached': cached}
+
+
+class Job:
+    """ simulation of one scenario in flight, identical requests subscribe to the same job instead of starting another one """
+
+    def __init__(self, cols):
+
+        self.Columns = cols
+        self.Acc = Accumulator()
+        self.Last = None  # last published message, new subscribers start with it
+        self.Listeners: list[asyncio.Queue] = []
+        self.Task: asyncio.Task | None = None  # the event loop only keeps a weak reference to the running task
+
+    def subscribe(self) -> asyncio.Queue:
+        q = asyncio.Queue()
+        if self.Last is not None:
+            q.put_nowait(self.Last)
+        self.Listeners.append(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue):
+        if q in self.Listeners:
+            self.Listeners.remove(q)
+
+    def publish(self, msg):
+        self.Last = msg
+        for q in self.Listeners:
+            q.put_nowait(msg)
+
+
+class SimulationService:
+    """ long-lived local simulation server (asyncio, json lines over a Unix socket or a localhost TCP port) with a warm process pool.
+        Every request is a scenario (see Scenario.from_dict) with the number of trials n. The partial statistics are streamed back as the chunks finish,
+        identical requests in flight are merged into one run and finished summaries are kept in the BattleCache. """
+
+    def __init__(self, path=None, port=None, n_workers=None, chunk_size=20000, cache: BattleCache = None, n_tables=512, warm=False):
+
+        self.Path = Path(choose(path, Dir.joinpath('data', 'service.sock')))
+        self.Port = port  # serves on localhost instead of the socket if given
+        self.NWorkers = choose(n_workers, cpu_count())
+        self.ChunkSize = chunk_size
+        self.NTables = n_tables  # kill tables cached per worker
+        self.Warm = warm  # fill the kill tables of the standard scenarios when the workers start
+        self.Cache = choose(cache, BattleCache())
+        self.CacheThread = ThreadPoolExecutor(1)  # all (blocking) sqlite calls of the cache run one after the other off the event loop
+        self.Seed = np.random.SeedSequence()
+        self.Pool = None
+        self.Jobs = {}  # (key, n) -> Job, the key of the cache includes the engine
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} with {self.NWorkers} workers on {self.Path if self.Port is None else f"localhost:{self.Port}"}'
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        self.Pool = ProcessPoolExecutor(self.NWorkers, initializer=init_worker, initargs=(self.NTables, self.Warm))
+        await asyncio.gather(*[loop.run_in_executor(self.Pool, int) for _ in range(self.NWorkers)])  # start all workers
+        if self.Port is None:
+            self.Path.parent.mkdir(parents=True, exist_ok=True)
+            self.Path.unlink(missing_ok=True)
+            server = await asyncio.start_unix_server(self.handle, self.Path)
+        else:
+            server = await asyncio.start_server(self.handle, 'localhost', self.Port)
+        info(f'serving {self!r}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """ cancels the running jobs and shuts down the workers """
+        tasks = [job.Task for job in self.Jobs.values() if job.Task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.Pool.shutdown(cancel_futures=True)
+        self.CacheThread.shutdown()
+
+    @staticmethod
+    async def send(writer: asyncio.StreamWriter, msg: dict):
+        writer.write(json.dumps(msg).encode() + b'\n')
+        await writer.drain()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """ answers the json requests of a connection line by line, every failed request is answered with an error """
+        try:
+            while line := await reader.readline():
+                try:
+                    async with aclosing(self.request(json.loads(line))) as msgs:  # a disconnect unsubscribes from the job right away
+                        async for msg in msgs:
+                            await self.send(writer, msg)
+                except ConnectionError:
+                    raise
+                except Exception as err:
+                    await self.send(writer, {'error': repr(err), 'done': True})
+        except ConnectionError as err:
+            warning(f'client went away: {err!r}')
+        finally:
+            writer.close()
+
+    async def request(self, spec: dict):
+        """ :returns async generator of the statistics of the scenario, the last one is done """
+        attackers, defender = Scenario.from_dict({'name': 'request', **spec}).armies()
+        n, engine = int(spec.get('n', 10000)), spec.get('engine', 'vectorized')
+        if engine not in Engines:
+            raise ValueError(f'unknown engine {engine}, choose from {", ".join(Engines)}')
+        key, armies = BattleCache.key(attackers, defender, engine)
+        cached = await asyncio.get_running_loop().run_in_executor(self.CacheThread, self.Cache.get, key)
+        if cached is not None and cached.n >= n:
+            yield message(cached, columns([*attackers, defender]), True, True)
+            return
+        if (key, n) not in self.Jobs:
+            job = self.Jobs[(key, n)] = Job(columns([*attackers, defender]))
+            job.Task = asyncio.create_task(self.run((key, n), engine, armies, attackers, defender, n - (0 if cached is None else cached.n)))
+        job = self.Jobs[(key, n)]
+        q = job.subscribe()
+        try:
+            while not (msg := await q.get())['done']:
+                yield msg
+            yield msg
+        finally:
+            job.unsubscribe(q)
+
+    async def run(self, job_key, engine, armies, attackers, defender, n):
+        """ simulates n trials in chunks on the pool and publishes the merged statistics after every chunk """
+        job, loop, f = self.Jobs[job_key], asyncio.get_running_loop(), Engines[engine]
+        size = max(1, min(self.ChunkSize, -(-n // self.NWorkers)))
+        chunks = [min(size, n - i) for i in range(0, n, size)]
+        try:
+            futures = [loop.run_in_executor(self.Pool, accumulate_chunk, f, m, seed, m, (attackers, defender)) for m, seed in zip(chunks, self.Seed.spawn(len(chunks)))]
+            for future in asyncio.as_completed(futures):
+                job.Acc.merge((await future)[0])
+                if job.Acc.n < n:
+                    job.publish(message(job.Acc, job.Columns, False))
+            acc = await loop.run_in_executor(self.CacheThread, self.Cache.add, job_key[0], armies, job.Acc)  # merged with the cached trials
+            job.publish(message(acc, job.Columns, True))
+        except Exception as err:
+            job.publish({'error': repr(err), 'done': True})
+        finally:
+            self.Jobs.pop(job_key)
+
+
+class SimulationClient:
+    """ blocking client of the SimulationService for the GUI, scripts and notebooks """
+
+    def __init__(self, path=None, port=None):
+
+        self.Path = Path(choose(path, Dir.joinpath('data', 'service.sock')))
+        self.Port = port
+
+    def connect(self):
+        if self.Port is None:
+            s = socket.socket(socket.AF_UNIX)
+            s.connect(str(self.Path))
+        else:
+            s = socket.create_connection(('localhost', self.Port))
+        return s
+
+    def stream(self, spec: dict):
+        """ :returns generator of the partial statistics of the scenario, the last one is done """
+        with self.connect() as s, s.makefile('rwb') as f:
+            f.write(json.dumps(spec).encode() + b'\n')
+            f.flush()
+            while line := f.readline():
+                msg = json.loads(line)
+                yield msg
+                if msg['done']:
+                    break
+
+    def __call__(self, spec: dict):
+        """ :returns the final statistics of the scenario """
+        for msg in self.stream(spec):
+            if 'error' in msg:
+                raise RuntimeError(msg['error'])
+        return msg
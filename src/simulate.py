@@ -0,0 +1,152 @@
+from math import gcd, prod
+from statistics import NormalDist
+from time import perf_counter
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.army import Army
+from src.exact import ExactSimulation
+from src.runner import Engines, Runner, accumulate_chunk
+from src.store import columns
+from utils.helpers import choose, info, warning
+
+ExactTime = .05  # the exact simulation is only tried if sampling takes longer
+ExactShare = .25  # share of the sampling time the exact simulation may take
+MaxStates = 1e8  # the exact simulation is only tried for smaller state spaces, see n_states, the time budget catches the rest
+ObjectTrials = 10  # the object engine has less overhead for a few fights
+PilotTrials = 1000  # trials to measure the spread of the fights
+TimingTrials = 10000  # trials to measure the speed of the fights, large enough to hide the overhead per call
+PoolTime = 1.  # seconds of simulation from which on the process pool pays off
+BatchSize = 100000
+
+
+class Result:
+    """ outcome of simulate in the format of Army.data, independent of the engine: the probabilities of the values of every column """
+
+    def __init__(self, engine, cols, probs: np.ndarray, n=None, lost=0., t=0.):
+
+        self.Engine = engine  # engine that produced the result
+        self.Columns = cols
+        self.Probs = probs  # shape (columns, max value + 1)
+        self.N = n  # number of fights, None for the exact simulation
+        self.Lost = lost  # probability dropped by the exact simulation
+        self.Time = t
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} of {"the exact simulation" if self.N is None else f"{self.N} fights"} ({self.Engine} engine, {self.Time:.2f} s)'
+
+    @classmethod
+    def from_accumulator(cls, acc: Accumulator, engine, cols, t=0.):
+        return cls(engine, cols, acc.Hists / acc.N, acc.N, t=t)
+
+    @classmethod
+    def from_exact(cls, s: ExactSimulation, cols, t=0.):
+        dists = [s.distribution(i) for i in range(len(cols))]
+        probs = np.zeros((len(cols), max(int(x.max()) for x, p in dists) + 1))
+        for row, (x, p) in zip(probs, dists):
+            row[x.astype('i')] = p / p.sum()
+        return cls('exact', cols, probs, lost=s.lost, t=t)
+
+    @property
+    def x(self):
+        return np.arange(self.Probs.shape[1])
+
+    @property
+    def exact(self):
+        return self.N is None
+
+    def index(self, i):
+        return self.Columns.index(i) if isinstance(i, str) else i
+
+    def mean(self):
+        return self.Probs @ self.x
+
+    def var(self):
+        return self.Probs @ self.x ** 2 - self.mean() ** 2
+
+    def std(self):
+        return np.sqrt(np.maximum(self.var(), 0))
+
+    def quantile(self, q):
+        """ :returns the q-quantiles of all columns """
+        return np.array([np.searchsorted(c, q - 1e-12) for c in np.cumsum(self.Probs, axis=1)])
+
+    def distribution(self, i):
+        """ :returns the values and probabilities of the i-th column (or the column with the given name) """
+        p = self.Probs[self.index(i)]
+        x = np.flatnonzero(p)
+        return x, p[x]
+
+    def ci_width(self, cl=.95):
+        """ :returns the width of the confidence interval of the mean of every column, 0 for the exact simulation """
+        return np.zeros(len(self.Columns)) if self.exact else 2 * NormalDist().inv_cdf((1 + cl) / 2) * self.std() / np.sqrt(self.N)
+
+
+def needed(acc: Accumulator, trials, precision, cl, max_trials):
+    """ :returns the number of trials for the precision (width of the confidence intervals of all means) or the given trials """
+    if precision is None:
+        return int(trials)
+    n = int(np.max((2 * NormalDist().inv_cdf((1 + cl) / 2) * np.nan_to_num(acc.std()) / precision) ** 2))
+    return int(min(max(n, acc.n), choose(trials, max_trials)))
+
+
+def n_states(attacker: Army, defender: Army):
+    """ :returns the size of the reachable state space of the exact simulation. The battalions of an army are attacked one after the other,
+        so only one of them is partly defeated at a time: the states of an army are the alive units times the HP values of the next unit of its front battalion """
+    def n_fronts(bat, enemy):
+        dmgs = [dmg for b in enemy for dmg in {b.Unit.DmgMin, b.Unit.DmgMax}]
+        return 1 if min(dmgs) >= bat.Unit.HP else bat.Unit.HP // gcd(*dmgs)
+    return prod(1 + sum(bat.N * n_fronts(bat, enemy) for bat in army) for army, enemy in [(attacker, defender), (defender, attacker)])
+
+
+def exact(attacker: Army, defender: Army, max_time=None) -> ExactSimulation:
+    """ :returns the finished exact simulation, raises a TimeoutError if it takes longer than max_time """
+    s = ExactSimulation(attacker, defender, max_time=max_time)
+    s.run()
+    return s
+
+
+def simulate(attackers, defender: Army, trials=None, precision=None, engine=None, cl=.95, max_trials=1e7, seed=None, runner: Runner = None) -> Result:
+    """ simulates the fights of the attackers (one army or several attacking one after the other) against the defender with the fastest engine.
+        :param trials: number of fights (10000 by default), or the maximum number if a precision is given
+        :param precision: width of the confidence intervals of the means of all columns, the fights go on until it is reached
+        :param engine: exact, object, vectorized or pooled (vectorized on the process pool of the runner). If None a few fights use the object engine,
+                       otherwise pilot runs of the vectorized engine measure the spread and the speed of the fights. A single attacker with a small state space
+                       is simulated exactly if that takes less than a share of the time of the remaining fights, long runs go to the process pool.
+        :returns the Result with the engine that was used """
+    if engine is not None and engine not in [*Engines, 'exact', 'pooled']:
+        raise ValueError(f'unknown engine {engine}, choose from {", ".join([*Engines, "exact", "pooled"])}')
+    attackers = [attackers] if isinstance(attackers, Army) else list(attackers)
+    cols, auto, t = columns([*attackers, defender]), engine is None, perf_counter()
+    trials = 10000 if trials is None and precision is None else trials
+    if engine == 'exact':
+        if len(attackers) > 1:
+            raise ValueError('the exact simulation only supports a single attacker')
+        return Result.from_exact(exact(attackers[0], defender), cols, perf_counter() - t)
+    engine = choose(engine, 'object' if trials is not None and trials <= ObjectTrials else 'vectorized')
+    seed = np.random.SeedSequence(seed)
+    runner = choose(runner, Runner(seed=int(seed.generate_state(1)[0])))
+    f, args = Engines['object' if engine == 'object' else 'vectorized'], (attackers, defender)
+    acc = accumulate_chunk(f, min(PilotTrials, choose(trials, max_trials)), seed.spawn(1)[0], BatchSize, args)[0]  # also fills the kill tables
+    dt = 0.  # seconds per fight
+    if (m := min(needed(acc, trials, precision, cl, max_trials) - acc.n, TimingTrials)) > 0:
+        t_timing = perf_counter()
+        acc.merge(accumulate_chunk(f, m, seed.spawn(1)[0], BatchSize, args)[0])
+        dt = (perf_counter() - t_timing) / m
+    t_left = (needed(acc, trials, precision, cl, max_trials) - acc.n) * dt
+    if auto and len(attackers) == 1 and t_left > ExactTime and n_states(attackers[0], defender) < MaxStates:
+        try:  # the exact simulation is only used if it beats sampling
+            return Result.from_exact(exact(attackers[0], defender, ExactShare * t_left), cols, perf_counter() - t)
+        except TimeoutError as err:
+            info(f'{err}, sampling instead')
+    while (n := needed(acc, trials, precision, cl, max_trials)) > acc.n:
+        m = n - acc.n
+        if engine == 'pooled' or (auto and engine == 'vectorized' and m * dt > PoolTime and runner.NWorkers > 1):
+            engine = 'pooled'
+            acc.merge(runner.summarise(attackers, defender, m))
+        else:
+            acc.merge(accumulate_chunk(f, m, seed.spawn(1)[0], BatchSize, args)[0])
+    if precision is not None and np.max(Result.from_accumulator(acc, engine, cols).ci_width(cl)) > precision:
+        warning(f'precision {precision} not reached after the maximum of {acc.n} trials')
+    return Result.from_accumulator(acc, engine, cols, perf_counter() - t)
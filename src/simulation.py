@@ -1,76 +1,255 @@
+from time import perf_counter
+
 import numpy as np
 import numpy.random as rnd
 
-from src.army import Army
+from src.army import Army, SpeedDict
 from src.battalion import Battalion
-from utils.helpers import warning
+from src.instrumentation import Stats
+import src.kill_table as tables
+
+
+class ArmyState:
+    """ state of all battalions of an army for many trials at once, arrays have the shape (battalions, trials) """
+
+    def __init__(self, army: Army, n, counts=None):
+
+        self.Army = army
+        self.HP = np.array([[bat.Unit.HP] for bat in army])
+        self.N = np.repeat([[bat.N] for bat in army], n, axis=1) if counts is None else np.asarray(counts)  # units of every trial
+        self.NDefeated = np.zeros_like(self.N)
+        self.NAlive = self.N.copy()  # alive units at the start of the speed phase
+        self.Front = np.repeat(self.HP, self.N.shape[1], axis=1)  # current HP of the next alive unit
+        self.Draws = {}  # (enemy battalion, stat) -> successes and failures of its biased draws in every trial (importance sampling)
+
+    def __getitem__(self, item):
+        return self.Army[item]
+
+    def take(self, cut) -> 'ArmyState':
+        """ :returns a copy of the state of the selected trials """
+        state, cut = ArmyState(self.Army, 0), np.flatnonzero(cut) if cut.dtype == bool else cut
+        state.N, state.NDefeated, state.Front = [np.take(x, cut, axis=1) for x in [self.N, self.NDefeated, self.Front]]  # keep the rows contiguous
+        state.Draws = {key: np.take(x, cut, axis=1) for key, x in self.Draws.items()}
+        state.update_n_alive()
+        return state
+
+    def put(self, cut, state: 'ArmyState'):
+        """ writes the state of the selected trials back """
+        self.NDefeated[:, cut], self.Front[:, cut] = state.NDefeated, state.Front
+        self.NAlive[:, cut] = self.N[:, cut] - self.NDefeated[:, cut]
+        for key, x in state.Draws.items():
+            self.draws(key)[:, cut] = x
+
+    def draws(self, key):
+        if key not in self.Draws:
+            self.Draws[key] = np.zeros((2, self.N.shape[1]), 'i')
+        return self.Draws[key]
+
+    def count(self, a: Battalion, stat, k, m, cut=...):
+        """ counts k successes and m failures of the biased draws of the stat (Accuracy or Splash) of the enemy battalion in the selected trials """
+        x = self.draws((a, stat))
+        x[0, cut] += k
+        x[1, cut] += m
+
+    def n_left(self, cut=...):
+        """ :returns the currently alive units of the selected trials """
+        return self.N[:, cut] - self.NDefeated[:, cut]
+
+    def has_speed_units(self, speed):
+        """ :returns whether there are alive units of the given speed in every trial """
+        return np.any(self.NAlive[[bat.Unit.Speed == speed for bat in self.Army]] > 0, axis=0)
+
+    @property
+    def defeated(self):
+        return np.all(self.NAlive == 0, axis=0)
+
+    @property
+    def defeated_(self):
+        return np.all(self.NDefeated == self.N, axis=0)
+
+    def update_n_alive(self):
+        self.NAlive = self.N - self.NDefeated
+
+    def order(self, flanking):
+        return self.Army.IHP if flanking else range(self.Army.N)
+
+    def take_splash(self, order, dmg):
+        """ splash damage of every trial spills over the alive units of the battalions in the given order.
+            :returns the damage exceeding the HP of all alive units """
+        for i in order:
+            dmg = self.absorb(i, dmg)
+        return dmg
+
+    def absorb(self, i, dmg, cut=...):
+        """ splash damage on battalion i for the selected trials.
+            :returns the damage exceeding the HP of its alive units """
+        left, front, hp = self.N[i, cut] - self.NDefeated[i, cut], self.Front[i, cut], self.HP[i, 0]
+        d = np.minimum(dmg, np.where(left > 0, front + (left - 1) * hp, 0))  # damage the battalion can take
+        over = d - front
+        if Stats.Enabled:
+            Stats.count('splash spill-overs', np.count_nonzero(over > 0))
+            Stats.count('excess carries', np.count_nonzero((d > 0) & (dmg > d)))
+        self.NDefeated[i, cut] += np.where(over >= 0, 1 + over // hp, 0)
+        self.Front[i, cut] = np.where(over >= 0, hp - over % hp, -over)
+        return dmg - d
+
+    def hit(self, i, dmg, cut):
+        """ single target attack of one unit per selected trial on the next alive unit of battalion i, damage exceeding its HP is lost """
+        front = self.Front[i, cut] - dmg
+        killed = front <= 0
+        self.NDefeated[i, cut] += killed
+        self.Front[i, cut] = np.where(killed, self.HP[i, 0], front)
 
 
 class FightSimulation:
 
     Speeds = [2, 1, 0]
 
-    def __init__(self, attacker: Army, defender: Army):
+    def __init__(self, attacker: Army, defender: Army, tables=True):
 
         self.Attacker = attacker
         self.Defender = defender
+        self.Tables = tables  # single target attacks are sampled from the kill tables, unit by unit otherwise
+        self.Draws = {}  # draws of the biased battalions in every trial of the last run, see ArmyState.Draws
 
     def __getitem__(self, item):
         return (list(self.Attacker) + list(self.Defender))[item]
 
-    def reset_battalions(self, n):
-        for bat in self:
-            bat.NAlive = np.full(int(n), bat.N)
-            bat.NDefeated = np.zeros(int(n), 'i')
-        self.reset_attacks(n)
+    @staticmethod
+    def dmg(a: Battalion, n, d: ArmyState = None, cut=...):
+        """ :returns the summed damage of n units for every trial, biased draws are counted in the selected trials of d """
+        n_high = (a.Rng or rnd).binomial(n, a.P)
+        if a.Nominal is not None:
+            d.count(a, 'Accuracy', n_high, n - n_high, cut)
+        return n_high * a.Unit.DmgMax + (n - n_high) * a.Unit.DmgMin
 
-    def reset_attacks(self, n):
-        for bat in self:
-            bat.NAttacks = np.zeros(int(n), 'i')
-            bat.ExcessDmg = 0
+    @staticmethod
+    def splash_attack(a: Battalion, d: ArmyState, n, tables=True):
+        """ all splash damage of the battalion is a single stream that spills over all enemy battalions, there are no kill tables for splash damage """
+        d.take_splash(d.order(a.Unit.Flanking), FightSimulation.dmg(a, n, d))
 
-    def update_n_alive(self):
-        for bat in self:
-            bat.NAlive = bat.N - bat.NDefeated
+    @staticmethod
+    def single_attack(a: Battalion, d: ArmyState, n, tables=True):
+        """ attack unit by unit, each one either hits the next alive unit or splashes with probability a.Unit.Splash """
+        n, excess = n.copy(), np.zeros(n.size, 'i')  # remaining attacks and splash damage carried over to the next battalion
+        for i in d.order(a.Unit.Flanking):
+            excess = d.absorb(i, excess)
+            if a.Unit.Splash == 0 and a.Unit.DmgMin >= d.HP[i, 0]:  # every attack kills a unit
+                n_killed = np.minimum(n, d.N[i] - d.NDefeated[i])
+                d.NDefeated[i] += n_killed
+                d.Front[i] = np.where(n_killed > 0, d.HP[i, 0], d.Front[i])
+                n -= n_killed
+                continue
+            safe = np.flatnonzero((n * a.Unit.DmgMax < d.Front[i]) & (d.N[i] > d.NDefeated[i]))  # attacks that cannot kill a unit
+            d.Front[i, safe] -= FightSimulation.dmg(a, n[safe], d, safe)
+            n[safe] = 0
+            if tables and a.Unit.Splash == 0 and d[i].N > 1 and a.Nominal is None:  # the HP of single units (bosses) take too many different values for tables
+                FightSimulation.table_attack(a, d, i, n)
+                continue
+            cut = np.flatnonzero(n > 0)
+            while cut.size:
+                cut = cut[d.N[i, cut] > d.NDefeated[i, cut]]
+                dmg = a._dmg(cut.size)
+                n[cut] -= 1
+                if a.Nominal is not None:
+                    d.count(a, 'Accuracy', dmg == a.Unit.DmgMax, dmg != a.Unit.DmgMax, cut)
+                if 0 < a.Unit.Splash < 1:
+                    splash = a.splash(cut.size)
+                    if a.Nominal is not None:
+                        d.count(a, 'Splash', splash, ~splash, cut)
+                    excess[cut[splash]] = d.absorb(i, dmg[splash], cut[splash])
+                    d.hit(i, dmg[~splash], cut[~splash])
+                else:
+                    d.hit(i, dmg, cut)
+                cut = cut[n[cut] > 0]
 
     @staticmethod
-    def splash_attack(a: Battalion, d: Battalion, dmg=0):
-        """ :returns the amount of killed units and the excess damage"""
-        if type(a.ExcessDmg) != np.ndarray:  # this is the attack on the first enemy battalion, add excess dmg from earlier attacking unit
-            n_high = rnd.binomial(a.n_can_attack, a.P)
-            dmg += (n_high * a.Unit.DmgMax + (a.n_can_attack - n_high) * a.Unit.DmgMin)
-        else:  # if there is dmg from the battalion attacked previously just continue with this dmg
-            dmg = a.ExcessDmg
-        n_killed = dmg // d.Unit.HP
-        cut = d.NAlive < n_killed
-        n_killed[cut] = d.NAlive[cut]
-        excess_dmg = dmg - n_killed * d.Unit.HP
-        d.NDefeated += n_killed
-        a.ExcessDmg = excess_dmg
-        return excess_dmg
+    def table_attack(a: Battalion, d: ArmyState, i, n):
+        """ single target attacks of all trials on battalion i, sampled from the kill tables of the HP of the next unit """
+        cut = np.flatnonzero((n > 0) & (d.N[i] > d.NDefeated[i]))
+        front = d.Front[i, cut]
+        for f in np.unique(front):
+            c = cut[front == f]
+            k, d.Front[i, c], used = tables.kill_table(a.Unit.stats, d[i].Unit.stats, int(f), d[i].N, a.N).sample(n[c], d.N[i, c] - d.NDefeated[i, c], a.Rng)
+            d.NDefeated[i, c] += k
+            n[c] -= used
 
     @staticmethod
-    def attack(a: Battalion, d: Battalion, dmg=0):
-        if a.Unit.Splash == 1:
-            return FightSimulation.splash_attack(a, d, dmg)
-        warning(f'{a} attacking {d} is not implemented yet...')
+    def attack(a: Battalion, d: ArmyState, n, tables=True):
+        """ attack of a battalion with n units per trial """
+        if Stats.Enabled:
+            Stats.count('attack calls', np.count_nonzero((n > 0) & ~d.defeated))
+        (FightSimulation.splash_attack if a.Unit.Splash == 1 else FightSimulation.single_attack)(a, d, n, tables)
 
     @staticmethod
-    def round(speed, attacker: Army, defender: Army):
-        """ simulate one round of a batallion attack"""
-        for a in attacker.speed_batallions(speed):
-            ind = iter(defender.indices(a.Unit.Flanking))
-            while a.can_attack and not defender.defeated:
-                try:
-                    i = next(ind)
-                except StopIteration:
-                    break
-                attacker.ExcessDmg = FightSimulation.attack(a, defender[i], attacker.ExcessDmg)
-            a.reset_attacks()
+    def round(speed, attacker: ArmyState, defender: ArmyState, tables=True):
+        """ simulate the attacks of all battalions of the given speed """
+        for i, a in enumerate(attacker.Army):
+            if a.Unit.Speed == speed:
+                FightSimulation.attack(a, defender, attacker.NAlive[i], tables)
+
+    def fight(self, a: ArmyState, d: ArmyState, compact=.25):
+        """ fights all trials until one of the armies is defeated. Once the given fraction of the trials is finished,
+            they are written back and dropped, so later rounds only work on the unfinished ones.
+            :returns the number of rounds of every trial """
+        n_rounds = np.zeros(a.N.shape[1], 'i')
+        live = np.flatnonzero(~(a.defeated | d.defeated))
+        a_live, d_live, active = a.take(live), d.take(live), np.ones(live.size, '?')
+        while live.size:
+            n_rounds[live[active]] += 1
+            phases = [active & (a_live.has_speed_units(s) | d_live.has_speed_units(s)) for s in self.Speeds] if Stats.Enabled else None  # like the object engine
+            for j, speed in enumerate(self.Speeds):
+                t = perf_counter() if Stats.Enabled else 0
+                self.round(speed, a_live, d_live, self.Tables)  # both attacks happen in parallel
+                self.round(speed, d_live, a_live, self.Tables)
+                a_live.update_n_alive()
+                d_live.update_n_alive()
+                if Stats.Enabled:
+                    Stats.count('phases', np.count_nonzero(phases[j]))
+                    Stats.time(f'{SpeedDict[speed]} phase', perf_counter() - t)
+            if Stats.Enabled:
+                Stats.count('rounds', np.count_nonzero(active))
+            active = ~(a_live.defeated | d_live.defeated)  # finished trials do nothing until they are dropped
+            if np.count_nonzero(~active) >= compact * live.size:
+                a.put(live[~active], a_live.take(~active))
+                d.put(live[~active], d_live.take(~active))
+                live, a_live, d_live, active = live[active], a_live.take(active), d_live.take(active), active[active]
+        return n_rounds
+
+    def run(self, n):
+        """ :returns the losses of both armies and the number of rounds for n trials in the format of Army.data """
+        a, d = ArmyState(self.Attacker, int(n)), ArmyState(self.Defender, int(n))
+        n_rounds = self.fight(a, d)
+        self.Draws = {**a.Draws, **d.Draws}
+        return np.concatenate([self.Attacker.format_data(a.NDefeated, n_rounds), self.Defender.format_data(d.NDefeated, n_rounds)]).T
+
+
+class WaveSimulation(FightSimulation):
+    """ several armies attack the same defender one after the other.
+        The surviving enemies and the HP of their wounded units carry over to the next wave, trials with a defeated defender drop out. """
+
+    def __init__(self, attackers, defender: Army, tables=True):
+        super().__init__(attackers[0], defender, tables)
+        self.Attackers = list(attackers)
+
+    def __getitem__(self, item):
+        return (sum([list(army) for army in self.Attackers], []) + list(self.Defender))[item]
 
     def run(self, n):
-        self.reset_battalions(n)
-        for speed in self.Speeds:
-            self.round(speed, self.Attacker, self.Defender)
-            self.round(speed, self.Defender, self.Attacker)
-            self.update_n_alive()
+        """ :returns the losses and number of rounds of all waves followed by the losses of the defender in the format of Army.data """
+        d, data, n_rounds = ArmyState(self.Defender, int(n)), [], np.zeros(int(n), 'i')
+        self.Draws = {}
+        for army in self.Attackers:
+            cut = np.flatnonzero(~d.defeated)
+            a, d_cut, n_defeated, rounds = ArmyState(army, cut.size), d.take(cut), np.zeros((army.N, int(n)), 'i'), np.zeros(int(n), 'i')
+            rounds[cut] = self.fight(a, d_cut)
+            d.put(cut, d_cut)
+            for key, x in a.Draws.items():  # the draws of the defender add up over all waves
+                if key not in self.Draws:
+                    self.Draws[key] = np.zeros((2, int(n)), 'i')
+                self.Draws[key][:, cut] += x
+            n_defeated[:, cut] = a.NDefeated
+            data.append(army.format_data(n_defeated, rounds))
+            n_rounds += rounds
+        self.Draws.update(d.Draws)
+        return np.concatenate(data + [self.Defender.format_data(d.NDefeated, n_rounds)]).T
@@ -0,0 +1,146 @@
+import json
+from pathlib import Path
+from shutil import rmtree
+
+import numpy as np
+
+from src.accumulator import Accumulator
+from src.army import Army
+from src.cache import BattleCache
+from utils.helpers import Dir, choose, info
+
+
+def columns(armies):
+    """ :returns the names of the columns of the data of a fight of the armies, see Army.data """
+    return sum([army.format_data(np.array([f'{bat.Unit.Name} losses' for bat in army]), 'Rounds').tolist() for army in armies], [])
+
+
+class Campaign:
+    """ columnar results of a simulation campaign. The trials are appended in chunks with the shape (columns, trials) as .npy files,
+        which are only mapped into memory when they are read, so every column of a chunk is a contiguous read-only view. """
+
+    def __init__(self, store: 'ResultStore', name):
+
+        self.Store = store
+        self.Name = name
+        self.Path = store.Path.joinpath(name)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} {self.Name} with {self.n} trials ({self.Meta["engine"]} engine)'
+
+    def __iter__(self):
+        return self.chunks()
+
+    @property
+    def Meta(self):
+        return self.Store.Index[self.Name]
+
+    @property
+    def n(self):
+        return sum(self.Meta['chunks'])
+
+    @property
+    def columns(self):
+        return self.Meta['columns']
+
+    def file_name(self, i):
+        return self.Path.joinpath(f'{i:06d}.npy')
+
+    def append(self, data: np.ndarray, state: dict = None):
+        """ stores a batch of trials with shape (trials, columns) as a new chunk, together with the state (engine and seeds, see Runner.state) that produced it """
+        if data.shape[0]:
+            self.Path.mkdir(parents=True, exist_ok=True)
+            np.save(self.file_name(len(self.Meta['chunks'])), np.ascontiguousarray(data.T))
+            self.Meta.setdefault('states', [None] * len(self.Meta['chunks'])).append(state)
+            self.Meta['chunks'].append(data.shape[0])
+            self.Store.save_index()
+
+    # ----------------------------------------
+    # region READ
+    def chunks(self):
+        """ :returns generator of the memory-mapped chunks with shape (columns, trials) """
+        return (np.load(self.file_name(i), mmap_mode='r') for i in range(len(self.Meta['chunks'])))
+
+    def column(self, i):
+        """ :returns generator of the views of the i-th column in all chunks """
+        i = self.columns.index(i) if type(i) is str else i
+        return (c[i] for c in self.chunks())
+
+    def hist(self, i):
+        """ :returns the counts of all values of the i-th column """
+        h = np.zeros(1, 'i8')
+        for x in self.column(i):
+            b = np.bincount(x)
+            h = np.pad(h, (0, max(b.size - h.size, 0)))
+            h[:b.size] += b
+        return h
+
+    def distribution(self, i):
+        """ :returns the values and probabilities of the i-th column """
+        h = self.hist(i)
+        x = np.flatnonzero(h)
+        return x, h[x] / max(h.sum(), 1)
+
+    def quantile(self, i, q):
+        """ :returns the exact q-quantiles of the i-th column """
+        return np.searchsorted(np.cumsum(self.hist(i)), np.asarray(q) * self.n)
+
+    def mean(self):
+        return sum(c.sum(1, dtype='i8') for c in self.chunks()) / self.n
+
+    def summary(self) -> Accumulator:
+        """ :returns the streaming summary of all columns, one chunk at a time """
+        acc = Accumulator(len(self.columns))
+        for c in self.chunks():
+            acc.add(c.T)
+        return acc
+    # endregion READ
+    # ----------------------------------------
+
+
+class ResultStore:
+    """ on-disk store of simulation campaigns, one directory of chunks per campaign and a small json index
+        with the armies, engine, seed and the trials and states of all chunks """
+
+    def __init__(self, path=None):
+
+        self.Path = Path(choose(path, Dir.joinpath('data', 'results')))
+        self.IndexFile = self.Path.joinpath('index.json')
+        self.Index = json.loads(self.IndexFile.read_text()) if self.IndexFile.exists() else {}
+
+    def __repr__(self):
+        return f'{self.__class__.__name__} with {len(self.Index)} campaigns in {self.Path}'
+
+    def __getitem__(self, name) -> Campaign:
+        if name not in self.Index:
+            raise KeyError(f'there is no campaign {name} in {self.Path}')
+        return Campaign(self, name)
+
+    def __contains__(self, name):
+        return name in self.Index
+
+    def __iter__(self):
+        return iter(self.Index)
+
+    def save_index(self):
+        self.Path.mkdir(parents=True, exist_ok=True)
+        tmp = self.IndexFile.with_suffix('.tmp')
+        tmp.write_text(json.dumps(self.Index))
+        tmp.replace(self.IndexFile)  # readers never see a partial index
+
+    def campaign(self, name, attackers, defender: Army, engine='vectorized', seed=None) -> Campaign:
+        """ :returns the campaign with the given name, it is created if it does not exist and has to match the armies otherwise """
+        armies = json.loads(BattleCache.key(attackers, defender)[1])
+        if name in self.Index:
+            if armies != self.Index[name]['armies']:
+                raise ValueError(f'the campaign {name} was simulated with different armies')
+            return self[name]
+        self.Index[name] = {'armies': armies, 'columns': columns([*attackers, defender]), 'engine': engine, 'seed': seed, 'chunks': []}
+        self.save_index()
+        info(f'created the campaign {name} in {self.Path}')
+        return self[name]
+
+    def remove(self, name):
+        rmtree(self.Path.joinpath(name), ignore_errors=True)
+        self.Index.pop(name)
+        self.save_index()
@@ -0,0 +1,106 @@
+import json
+import pickle
+from inspect import signature
+from itertools import product
+
+import numpy as np
+
+import src.army
+from src.army import Army, OwnArmy
+from src.runner import Runner
+from src.scenario import Scenarios
+from src.sweep import Sweep
+from utils.helpers import Dir, choose, info
+
+
+class Surrogate:
+    """ precomputed means and standard deviations of all columns on a grid of compositions of the attacker against one named defender.
+        The grids are stored as .npy files which are mapped read-only, so all processes share the same pages. Lookups interpolate
+        multilinearly between the grid points and fall back to a live simulation outside of the grid. """
+
+    def __init__(self, name, runner: Runner = None):
+
+        self.Name = name
+        self.Path = self.path(name)
+        with open(self.Path.joinpath('meta.json')) as f:
+            meta = json.load(f)
+        self.Army = getattr(src.army, meta['army'])
+        self.Axes = {key: np.array(values) for key, values in meta['axes'].items()}
+        params = list(signature(self.Army.__init__).parameters.values())[1:]
+        self.Fixed = {**{p.name: p.default for p in params}, **meta['fixed']}  # counts of the unit types off the grid
+        self.Columns = meta['columns']
+        self.N = meta['n']  # trials per grid point
+        self.Mean, self.Std = [np.load(self.Path.joinpath(f'{s}.npy'), mmap_mode='r') for s in ['mean', 'std']]
+        self.Defender: Army | None = None
+        self.Runner = choose(runner, Runner(1))
+
+    def __repr__(self):
+        axes = ' x '.join(f'{key} ({v.size})' for key, v in self.Axes.items())
+        return f'{self.__class__.__name__} {self.Name} of {axes} ({self.N} trials per point)'
+
+    @staticmethod
+    def path(name):
+        return Dir.joinpath('data', 'surrogates', name)
+
+    @classmethod
+    def build(cls, name, n=1000, defender: Army = None, army=OwnArmy, fixed: dict = None, batch_size=1e6, **grid):
+        """ simulates n trials of every composition of the grid (e.g. cavalry=range(0, 100, 10)) against the defender
+            (default the defender of the scenario with the same name) and stores the statistics of all columns.
+            :returns the surrogate mapped from the files """
+        defender = Scenarios[name].Defender() if defender is None else defender
+        s = Sweep(defender, army, fixed, **{key: sorted(values) for key, values in grid.items()})
+        n_batch = int(max(1, min(n, batch_size // np.prod(s.Shape, dtype='i8'))))  # bounds the memory of a single sweep
+        m = [(s.run(k), s.Std, k) for k in [n_batch] * (int(n) // n_batch) + [int(n) % n_batch] if k]
+        n_tot = sum(k for mean, std, k in m)
+        mean = sum(k * mean for mean, std, k in m) / n_tot
+        std = np.sqrt(sum((k - 1) * np.nan_to_num(std) ** 2 + k * (mu - mean) ** 2 for mu, std, k in m) / max(n_tot - 1, 1))
+        path = cls.path(name)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path.joinpath('mean.npy'), mean)
+        np.save(path.joinpath('std.npy'), std)
+        with open(path.joinpath('defender.pkl'), 'wb') as f:
+            pickle.dump(defender, f)
+        with open(path.joinpath('meta.json'), 'w') as f:
+            json.dump({'army': army.__name__, 'axes': {key: v.tolist() for key, v in s.Axes.items()}, 'fixed': choose(fixed, {}), 'columns': s.Columns, 'n': n_tot}, f)
+        info(f'Stored {np.prod(s.Shape)} grid points with {n_tot} trials each in {path}')
+        return cls(name)
+
+    # ----------------------------------------
+    # region LOOKUP
+    def counts(self, counts: dict):
+        """ :returns the counts of all unit types of the army """
+        return {**self.Fixed, **counts}
+
+    def inside(self, counts: dict):
+        """ :returns whether the composition is covered by the grid """
+        counts = self.counts(counts)
+        return all(counts[key] == v for key, v in self.Fixed.items() if key not in self.Axes) and all(a[0] <= counts[key] <= a[-1] for key, a in self.Axes.items())
+
+    def interpolate(self, counts: dict):
+        """ :returns the multilinear interpolation of the means of all columns between the neighbouring grid points """
+        corners, counts = [], self.counts(counts)
+        for key, a in self.Axes.items():
+            v = counts[key]
+            i = int(np.clip(np.searchsorted(a, v, 'right') - 1, 0, max(a.size - 2, 0)))
+            t = (v - a[i]) / (a[i + 1] - a[i]) if a.size > 1 else 0.
+            corners.append([(i, 1 - t), (i + 1, t)] if t > 0 else [(i, 1.)])
+        return sum(np.prod([w for i, w in c]) * self.Mean[tuple(i for i, w in c)] for c in product(*corners))
+
+    def simulate(self, counts: dict, n=None):
+        """ :returns the means of the columns of the grid from n live fights """
+        if self.Defender is None:
+            with open(self.Path.joinpath('defender.pkl'), 'rb') as f:
+                self.Defender = pickle.load(f)
+        army = self.Army(**self.counts(counts))
+        data, i = self.Runner.fight([army], self.Defender, choose(n, self.N)).mean(0), self.Columns.index('Rounds') + 1
+        values = dict(zip([f'{bat.Unit.Name} losses' for bat in army] + ['Rounds'], data))  # unit types without units have no column
+        return np.append([values.get(c, 0.) for c in self.Columns[:i]], data[army.N + 1:])
+
+    def __call__(self, n=None, **counts):
+        """ :returns the means of all columns for the composition, interpolated on the grid or from n live fights outside of it """
+        return self.interpolate(counts) if self.inside(counts) else self.simulate(counts, n)
+
+    def column(self, name, **counts):
+        return self(**counts)[self.Columns.index(name)]
+    # endregion LOOKUP
+    # ----------------------------------------
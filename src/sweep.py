@@ -0,0 +1,79 @@
+from copy import deepcopy
+from inspect import signature
+from itertools import product
+
+import numpy as np
+
+from src.army import Army, OwnArmy
+from src.checkpoint import Checkpoint
+from src.runner import encode
+from src.simulation import ArmyState, FightSimulation
+from utils.helpers import choose
+
+
+class Sweep:
+    """ simulates a grid of compositions of the attacking army against one defender in a single batch.
+        The states have the shape (battalions, configs x trials), each configuration only differs in the unit counts. """
+
+    def __init__(self, defender: Army, army=OwnArmy, fixed: dict = None, seed=None, **grid):
+        """ :param fixed: unit counts of all configurations, e.g. dict(general=1)
+            :param grid: values of the varied unit counts, e.g. cavalry=range(0, 100, 10) """
+
+        self.Defender = deepcopy(defender)  # bound to the generator of the sweep, the defender of the caller keeps its own
+        self.Axes = {key: np.asarray(values) for key, values in grid.items()}
+        self.Shape = tuple(v.size for v in self.Axes.values())
+
+        params = list(signature(army.__init__).parameters.values())[1:]  # counts in the order of army.Units
+        counts = {**{p.name: p.default for p in params}, **choose(fixed, {})}
+        self.Counts = np.array([[config.get(p.name, counts[p.name]) for p in params] for config in self.configs()], 'i')  # (configs, units)
+        self.Army = army.__new__(army)
+        Army.__init__(self.Army, *self.Counts.max(0).tolist(), max_units=np.inf)  # contains the largest count of every unit type
+        self.Counts = self.Counts[:, self.Counts.max(0) > 0]
+
+        self.Columns = [f'{bat.Unit.Name} losses' for bat in self.Army] + ['Rounds'] + [f'{bat.Unit.Name} losses' for bat in self.Defender]
+        self.Seed = seed
+        self.Rng = np.random.default_rng(seed)
+        self.Mean, self.Std = None, None
+
+    def __repr__(self):
+        axes = ' x '.join(f'{key} ({v.size})' for key, v in self.Axes.items())
+        return f'{self.__class__.__name__} of {axes} vs. {self.Defender}'
+
+    def configs(self):
+        return [dict(zip(self.Axes, values)) for values in product(*self.Axes.values())]
+
+    def batch(self, n):
+        """ :returns the data of n trials of every configuration with the shape (configs, trials, columns) """
+        for army in [self.Army, self.Defender]:
+            army.set_rng(self.Rng)
+        a = ArmyState(self.Army, 0, counts=np.repeat(self.Counts.T, n, axis=1))
+        d = ArmyState(self.Defender, a.N.shape[1])
+        n_rounds = FightSimulation(self.Army, self.Defender).fight(a, d)
+        return np.concatenate([self.Army.format_data(a.NDefeated, n_rounds), self.Defender.format_data(d.NDefeated, n_rounds)]).T.reshape(-1, n, len(self.Columns))
+
+    def run(self, n, batch_size=None, checkpoint: Checkpoint = None):
+        """ simulates n trials of every configuration in batches. The exact sums of the finished batches and the state of the random stream
+            are checkpointed, so an interrupted sweep resumes with the identical result.
+            :returns the mean of all columns with the shape (*grid, columns) """
+        n = int(n)
+        batch_size = int(choose(batch_size, n))
+        key = (encode([self.Army, self.Defender]), self.Counts.tolist(), n, batch_size, self.Seed)  # a random seed (None) resumes with the stream of the checkpoint
+        state = (None if checkpoint is None else checkpoint.load(key)) or {'n': 0, 'sum': 0, 'sum2': 0, 'rng': self.Rng.bit_generator.state}
+        self.Rng.bit_generator.state = state['rng']
+        while state['n'] < n:
+            data = self.batch(min(batch_size, n - state['n'])).astype('i8')
+            state = {'n': state['n'] + data.shape[1], 'sum': state['sum'] + data.sum(1), 'sum2': state['sum2'] + (data ** 2).sum(1), 'rng': self.Rng.bit_generator.state}
+            if checkpoint is not None:
+                checkpoint.save(key, state, force=state['n'] == n)
+        mean = state['sum'] / n
+        self.Mean, self.Std = [x.reshape(self.Shape + (-1,)) for x in [mean, np.sqrt(np.maximum(state['sum2'] - n * mean ** 2, 0) / max(n - 1, 1))]]
+        return self.Mean
+
+    def column(self, name):
+        """ :returns the mean of the column with the given name on the grid """
+        return self.Mean[..., self.Columns.index(name)]
+
+    @property
+    def losses(self):
+        """ :returns the mean of the total losses of the attacker (without the General) on the grid """
+        return sum(self.Mean[..., i] for i, bat in enumerate(self.Army) if bat.Unit.Name != 'General')
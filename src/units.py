@@ -1,29 +1,37 @@
 from utils.helpers import choose
+import numpy as np
 import numpy.random as rnd
 
 
 class Unit:
+    """ immutable stat line of a unit type, the state of the single units is kept in the battalions """
+
+    __slots__ = ['Name', 'HP', 'DmgMin', 'DmgMax', 'Accuracy', 'Speed', 'Splash', 'Flanking']
 
     def __init__(self, name, hp, dmg_min, dmg_max, accuracy, speed, splash=None, flanking=None):
-        self.Name = name
-        self.HP = hp
-        self.DmgMin = dmg_min
-        self.DmgMax = dmg_max
-        self.Accuracy = accuracy
-        self.Speed = speed
-        self.Splash = choose(splash, 1 if speed == 0 else 0)
-        self.Flanking = choose(flanking, speed == 2)
-
-        self.CurrentHP = hp
-        self.Hits = 0
-        self.Dead = False
+        for attr, value in zip(self.__slots__, [name, hp, dmg_min, dmg_max, accuracy, speed, choose(splash, 1 if speed == 0 else 0), choose(flanking, speed == 2)]):
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f'{self.__class__.__name__} is immutable, use replace()')
+
+    def __delattr__(self, item):
+        raise AttributeError(f'{self.__class__.__name__} is immutable')
+
+    def __reduce__(self):
+        return self.__class__, self.stats
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __repr__(self):
         return (f'{self.Name} unit\n'
-                f'  HP: {self.CurrentHP}/{self.HP} {f"({self.Hits} Hits)" if self.Hits else ""}\n'
+                f'  HP: {self.HP}\n'
                 f'  Damage: {self.DmgMin}-{self.DmgMax}\n'
-                f'  Accuracy: {self.Accuracy:.0%}\n'
-                f'  Dead: {self.Dead}')
+                f'  Accuracy: {self.Accuracy:.0%}')
 
     def __mul__(self, other):
         from src.army import Battalion
@@ -33,21 +41,21 @@ class Unit:
     def dmg(self):
         return self.DmgMax if rnd.random() < self.Accuracy else self.DmgMin
 
-    def kill(self):
-        self.CurrentHP = 0
-        self.Hits += 1
-        self.Dead = True
+    @property
+    def stats(self):
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def replace(self, accuracy=None, splash=None, flanking=None):
+        """ :returns a copy of the unit with the given stats overridden """
+        return Unit(self.Name, self.HP, self.DmgMin, self.DmgMax, choose(accuracy, self.Accuracy), self.Speed, choose(splash, self.Splash), choose(flanking, self.Flanking))
 
-    def revive(self):
-        self.CurrentHP = self.HP
-        self.Dead = False
-        self.Hits = 0
+    def attack(self, battalion, dmg=None):
+        """ single target attack on the next alive unit of the battalion, damage exceeding its HP is lost """
+        battalion.take_hits(np.array([choose(dmg, self.dmg)]))
 
-    def attack(self, unit: 'Unit', dmg=None):
-        unit.CurrentHP -= choose(dmg, self.dmg)
-        unit.Dead = unit.CurrentHP <= 0
-        unit.Hits += 1
-        return -unit.CurrentHP  # remaining dmg
+    def splash_attack(self, battalion, dmg=None):
+        """ :returns the damage exceeding the HP of all alive units of the battalion """
+        return battalion.take_splash(choose(dmg, self.dmg))
 
 
 # Own Units
@@ -56,6 +64,7 @@ Militia = Unit('Militia', 60, 20, 40, .8, 1)
 Soldier = Unit('Soldier', 90, 20, 40, .85, 1)
 Bowman = Unit('Bowman', 10, 20, 40, .8, 1)
 LongBowman = Unit('LongBowman', 10, 30, 60, .8, 1)
+Longbowman = LongBowman  # name used by the armies
 Cavalry = Unit('Cavalry', 5, 5, 10, .8, 2)
 General = Unit('General', 1, 180, 180, .8, 1, splash=1)
 
@@ -0,0 +1,14 @@
+import numpy as np
+
+from src.crn import Stream
+
+
+def test_coupling():
+    """ common streams couple the binomial draws of variants with different unit counts, antithetic streams anti-correlate them """
+    seed, n = np.random.SeedSequence(1), np.full(10000, 100)
+    x, y, z = [Stream(seed, anti).binomial(n + dn, .8) for dn, anti in [(0, False), (1, False), (0, True)]]
+    independent = Stream(np.random.SeedSequence(2)).binomial(n + 1, .8)
+    assert np.all((y - x >= 0) & (y - x <= 1))
+    assert np.var(x - y) < .05 * np.var(x - independent)
+    assert np.corrcoef(x, z)[0, 1] < -.9
+    assert abs(x.mean() / 80 - 1) < .01 and abs(x.var() / 16 - 1) < .1  # still binomial
@@ -0,0 +1,20 @@
+import numpy as np
+
+from src.army import EnemyArmy, OwnArmy
+from src.kill_table import kill_table
+from src.simulation import ArmyState, FightSimulation
+
+
+def test_sample():
+    """ the kills and HP of the next unit sampled from the kill table agree with the unit by unit attacks of single_attack """
+    n, attacker, defender = 200000, OwnArmy(recruits=20, general=0), EnemyArmy(roughnecks=10)
+    a, d, hp = attacker[0], ArmyState(defender, n), defender[0].Unit.HP
+    a.Rng = np.random.default_rng(1)
+    FightSimulation.single_attack(a, d, np.full(n, a.N), tables=False)
+    table = kill_table(a.Unit.stats, defender[0].Unit.stats, hp, defender[0].N, a.N)
+    kills, front, used = table.sample(np.full(n, a.N), np.full(n, defender[0].N), np.random.default_rng(2))
+    size = (defender[0].N + 1) * (hp + 1)  # one bin for every pair of kills and HP of the next unit
+    x, y = [np.bincount(k * (hp + 1) + f, minlength=size) for k, f in [(d.NDefeated[0], d.Front[0]), (kills, front)]]
+    occupied = x + y > 0
+    chi2, dof = np.sum((x - y)[occupied] ** 2 / (x + y)[occupied]), np.count_nonzero(occupied) - 1  # two samples of the same size
+    assert chi2 < dof + 5 * np.sqrt(2 * dof)
@@ -0,0 +1,14 @@
+import numpy as np
+
+from src.army import EnemyArmy, OwnArmy
+from src.rare import RareEvent, losses
+from src.runner import Runner
+
+
+def test_waves():
+    """ the importance sampled probability of losses of the second wave agrees with plain Monte Carlo """
+    attackers, defender = [OwnArmy(recruits=40), OwnArmy(soldiers=40)], EnemyArmy(0, 40, 20, 10)
+    i = attackers[0].data.size  # soldiers of the second wave
+    p = np.mean(Runner(1, seed=1).fight(attackers, defender, 400000)[:, i] >= 20)
+    p_is = np.mean([RareEvent(attackers, defender, losses(i, 20), seed=seed).estimate(40000, .05)[0] for seed in range(5)])
+    assert abs(p_is / p - 1) < .1
@@ -0,0 +1,12 @@
+import numpy as np
+
+from src.army import EnemyArmy, OwnArmy
+from src.runner import Runner
+
+
+def test_vectorized():
+    """ the vectorized engine agrees with the object engine for an army with a splash unit (General) """
+    attackers, defender = [OwnArmy(soldiers=60)], EnemyArmy(guard_dogs=10, roughnecks=20)
+    x, y = [Runner(1, seed=1).fight(attackers, defender, 4000, engine) for engine in ['object', 'vectorized']]
+    assert x.shape == y.shape
+    assert np.all(np.abs(x.mean(0) - y.mean(0)) <= 5 * np.sqrt((x.var(0) + y.var(0)) / 4000) + 1e-9)